@@ -0,0 +1,398 @@
+import argparse, json, random, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+
+"""
+bench/mock_server.py - a local stand-in for the BigCommerce v2/v3 API.
+
+Serves a generated store (products, categories, brands, customers, orders)
+over plain http for benchmarks, with configurable catalog size, page size,
+latency, rate limit headers and error injection. Point bigcli at it with
+BIGCLI_API_ORIGIN=http://127.0.0.1:<port>. The first line printed is the
+url it listens on.
+
+Every store hash gets its own copy of the store; hashes given with --empty
+start with no records (ex: the target of a copy).
+
+GET /__stats returns request counts since start (or the last reset), and
+POST /__reset restores the generated stores and zeroes the counts.
+"""
+
+V3 = ['catalog/products', 'catalog/categories', 'catalog/brands', 'customers']
+V2 = ['orders']
+BATCH_LIMIT = 10
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='Mock BigCommerce API for benchmarks')
+    parser.add_argument('--port', type=int, default=0, help='port to listen on (default: any free port)')
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--categories', type=int, default=200)
+    parser.add_argument('--brands', type=int, default=50)
+    parser.add_argument('--customers', type=int, default=2000)
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--dangling', type=float, default=0.05, help='share of products in a deleted category')
+    parser.add_argument('--max-page-size', type=int, default=250, help='largest limit a list request gets')
+    parser.add_argument('--latency', type=float, default=0, help='ms added to every response')
+    parser.add_argument('--jitter', type=float, default=0, help='up to this many random ms added on top')
+    parser.add_argument('--quota', type=int, default=100000, help='requests per rate limit window (ex: 150 for a standard plan)')
+    parser.add_argument('--window', type=int, default=30000, help='rate limit window in ms')
+    parser.add_argument('--error-rate', type=float, default=0, help='share of requests answered with a 503')
+    parser.add_argument('--empty', metavar='HASH', action='append', default=[], help='store hash that starts empty (repeatable)')
+    parser.add_argument('--seed', type=int, default=1)
+    return parser
+
+
+class Store():
+    """The generated store, plus whatever writes a run has made to it"""
+
+    def __init__(self, config, empty=False):
+        self.config = config
+        self.empty = empty
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        c = self.config
+        counts = {'catalog/products': c.products, 'catalog/categories': c.categories,
+            'catalog/brands': c.brands, 'customers': c.customers, 'orders': c.orders}
+        if self.empty:
+            counts = {name: 0 for name in counts}
+        with self.lock:
+            self.ids = {name: list(range(1, n + 1)) for name, n in counts.items()}
+            self.records = {name: {} for name in counts}
+            self.next_id = {name: n + 1 for name, n in counts.items()}
+
+    def record(self, name, id):
+        """Returns the record with id, generating it the first time"""
+        records = self.records[name]
+        if id not in records:
+            records[id] = getattr(self, 'make_' + name.split('/')[-1])(id, random.Random(self.config.seed * 1000003 + id))
+        return records[id]
+
+    def make_products(self, id, r):
+        c = self.config
+        categories = r.sample(range(1, c.categories + 1), min(c.categories, r.randint(1, 3)))
+        if r.random() < c.dangling:
+            categories.append(c.categories + r.randint(1, 50))  # deleted category
+        return {'id': id, 'name': 'Product {}'.format(id), 'type': 'physical', 'sku': 'SKU-{:06d}'.format(id),
+            'price': round(r.uniform(1, 500), 2), 'weight': round(r.uniform(0.1, 20), 2),
+            'categories': categories, 'brand_id': r.randint(0, c.brands), 'inventory_level': r.randint(0, 1000),
+            'is_visible': r.random() > 0.1, 'description': '<p>{}</p>'.format('Lorem ipsum dolor sit amet. ' * r.randint(1, 8)),
+            'custom_fields': [{'id': i, 'name': 'field_{}'.format(i), 'value': str(r.randint(0, 99))} for i in range(r.randint(0, 3))],
+            'variants': make_variants(id, 'SKU-{:06d}'.format(id), ['S', 'M', 'L'][:r.randint(0, 3)]),
+            'date_modified': '2024-{:02d}-{:02d}T12:00:00+00:00'.format(r.randint(1, 12), r.randint(1, 28))}
+
+    def make_categories(self, id, r):
+        parent_id = 0 if id <= 10 else r.randint(1, id - 1)
+        return {'id': id, 'parent_id': parent_id, 'name': 'Category {}'.format(id), 'description': '',
+            'sort_order': r.randint(0, 100), 'is_visible': True, 'custom_url': {'url': '/category-{}/'.format(id), 'is_customized': False}}
+
+    def make_brands(self, id, r):
+        return {'id': id, 'name': 'Brand {}'.format(id), 'page_title': '', 'meta_keywords': [], 'image_url': ''}
+
+    def make_customers(self, id, r):
+        return {'id': id, 'email': 'customer{}@example.com'.format(id), 'first_name': 'First{}'.format(id),
+            'last_name': 'Last{}'.format(id), 'company': '', 'customer_group_id': r.randint(0, 3),
+            'date_modified': '2024-{:02d}-{:02d}T12:00:00Z'.format(r.randint(1, 12), r.randint(1, 28))}
+
+    def make_orders(self, id, r):
+        return {'id': id, 'customer_id': r.randint(1, max(self.config.customers, 1)), 'status_id': r.randint(0, 14),
+            'total_inc_tax': '{:.4f}'.format(r.uniform(5, 2000)), 'items_total': r.randint(1, 10),
+            'date_modified': 'Mon, {:02d} Jan 2024 12:00:00 +0000'.format(r.randint(1, 28)),
+            'billing_address': {'first_name': 'First', 'last_name': 'Last', 'city': 'Austin', 'zip': '78701', 'country_iso2': 'US'}}
+
+    def list(self, name, params):
+        """Returns (records, total) for one page of a collection"""
+        limit = min(int(params.get('limit', 50)), self.config.max_page_size)
+        page = max(int(params.get('page', 1)), 1)
+        filters = {k: v for k, v in params.items() if k not in ['page', 'limit', 'include', 'include_fields', 'exclude_fields']}
+        with self.lock:
+            ids = self.ids[name]
+            if not filters:
+                return [self.record(name, id) for id in ids[(page - 1) * limit:page * limit]], len(ids)
+            matched = [r for r in (self.record(name, id) for id in ids) if matches(r, filters)]
+        return matched[(page - 1) * limit:page * limit], len(matched)
+
+    def get(self, name, id):
+        with self.lock:
+            return self.record(name, id) if id in self.ids[name] else None
+
+    def update(self, name, id, fields):
+        with self.lock:
+            if id not in self.ids[name]:
+                return None
+            record = self.record(name, id)
+            record.update({k: v for k, v in fields.items() if k != 'id'})
+            return record
+
+    def create(self, name, fields):
+        with self.lock:
+            id = self.next_id[name]
+            self.next_id[name] += 1
+            self.ids[name].append(id)
+            self.records[name][id] = dict(fields, id=id)
+            if name == 'catalog/products':
+                labels = [o['label'] for v in fields.get('variants', []) for o in v.get('option_values', [])]
+                self.records[name][id]['variants'] = make_variants(id, fields.get('sku', ''), labels)
+            return self.records[name][id]
+
+    def delete(self, name, ids):
+        with self.lock:
+            gone = set(ids)
+            self.ids[name] = [id for id in self.ids[name] if id not in gone]
+
+
+def make_variants(product_id, sku, sizes):
+    """A base variant, or one variant per size"""
+    if not sizes:
+        return [{'id': product_id * 10, 'product_id': product_id, 'sku': sku, 'option_values': []}]
+    return [{'id': product_id * 10 + i, 'product_id': product_id, 'sku': '{}-{}'.format(sku, size),
+        'option_values': [{'id': i, 'option_id': 1, 'option_display_name': 'Size', 'label': size}]}
+        for i, size in enumerate(sizes)]
+
+def matches(record, filters):
+    """Applies v3 style filters, ex: id:in=1,2 price:min=10 is_visible=true"""
+    for key, value in filters.items():
+        field, _, op = key.partition(':')
+        v = record.get(field)
+        if op == 'in':
+            if not any(str(x) in value.split(',') for x in (v if isinstance(v, list) else [v])):
+                return False
+        elif op in ['min', 'max', 'greater', 'less']:
+            try:
+                v, bound = float(v), float(value)
+            except (TypeError, ValueError):
+                v, bound = str(v), value
+            if {'min': v < bound, 'max': v > bound, 'greater': v <= bound, 'less': v >= bound}[op]:
+                return False
+        elif op == 'like':
+            if value.lower() not in str(v).lower():
+                return False
+        elif str(v).lower() != value.lower():
+            return False
+    return True
+
+def select_fields(record, params):
+    includes = params.get('include', '').split(',')
+    if 'variants' in record and 'variants' not in includes:
+        record = {k: v for k, v in record.items() if k != 'variants'}
+    if 'include_fields' in params:
+        keep = set(params['include_fields'].split(',')) | {'id'} | set(includes)
+        return {k: v for k, v in record.items() if k in keep}
+    if 'exclude_fields' in params:
+        drop = set(params['exclude_fields'].split(',')) - {'id'}
+        return {k: v for k, v in record.items() if k not in drop}
+    return record
+
+
+class Stats():
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counts = {'requests': 0, 'methods': {}, 'statuses': {}, 'endpoints': {}, 'bytes_out': 0}
+
+    def record(self, method, endpoint, status, size):
+        with self.lock:
+            c = self.counts
+            c['requests'] += 1
+            c['bytes_out'] += size
+            c['methods'][method] = c['methods'].get(method, 0) + 1
+            c['statuses'][str(status)] = c['statuses'].get(str(status), 0) + 1
+            key = '{} {}'.format(method, endpoint)
+            c['endpoints'][key] = c['endpoints'].get(key, 0) + 1
+
+    def snapshot(self):
+        with self.lock:
+            return json.loads(json.dumps(self.counts))
+
+
+class RateLimit():
+    """Fixed window request quota, reported the way BigCommerce does"""
+
+    def __init__(self, quota, window_ms):
+        self.quota = quota
+        self.window = window_ms / 1000
+        self.lock = threading.Lock()
+        self.start = time.monotonic()
+        self.used = 0
+
+    def take(self):
+        """Returns (allowed, requests left, ms until reset)"""
+        with self.lock:
+            now = time.monotonic()
+            if now - self.start >= self.window:
+                self.start, self.used = now, 0
+            reset_ms = max(int((self.start + self.window - now) * 1000), 1)
+            if self.used >= self.quota:
+                return False, 0, reset_ms
+            self.used += 1
+            return True, self.quota - self.used, reset_ms
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.handle_api('GET')
+
+    def do_PUT(self):
+        self.handle_api('PUT')
+
+    def do_POST(self):
+        self.handle_api('POST')
+
+    def do_DELETE(self):
+        self.handle_api('DELETE')
+
+    def log_message(self, *args):
+        pass
+
+    def handle_api(self, method):
+        server = self.server
+        self.rate_headers, self.endpoint = {}, None
+        url = urlsplit(self.path)
+        params = dict(parse_qsl(url.query))
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+
+        if url.path == '/__stats':
+            return self.send(200, server.stats.snapshot(), count=False)
+        if url.path == '/__reset':
+            for store in server.stores.values():
+                store.reset()
+            server.stats.reset()
+            return self.send(200, {}, count=False)
+
+        delay = server.config.latency + random.uniform(0, server.config.jitter)
+        if delay:
+            time.sleep(delay / 1000)
+        allowed, left, reset_ms = server.rate_limit.take()
+        self.rate_headers = {'X-Rate-Limit-Requests-Left': left, 'X-Rate-Limit-Time-Reset-Ms': reset_ms,
+            'X-Rate-Limit-Requests-Quota': server.config.quota, 'X-Rate-Limit-Time-Window-Ms': server.config.window}
+        parts = url.path.strip('/').split('/')
+        if len(parts) < 4 or parts[0] != 'stores':
+            return self.send(404, {'title': 'Not found'}, endpoint=url.path)
+        self.store = server.store(parts[1])
+        version, path = parts[2], parts[3:]
+        endpoint = '/{}/{}'.format(version, '/'.join('{id}' if p.isdigit() else p for p in path))
+        self.endpoint = endpoint
+        if not allowed:
+            return self.send(429, {'title': 'Too many requests'})
+        if server.config.error_rate and random.random() < server.config.error_rate:
+            return self.send(503, {'title': 'Service unavailable'})
+        if version == 'v2':
+            return self.handle_v2(method, path, params, body)
+        return self.handle_v3(method, path, params, body)
+
+    def handle_v3(self, method, path, params, body):
+        store = self.store
+        id = int(path[-1]) if path[-1].isdigit() else None
+        name = '/'.join(path[:-1] if id else path)
+        if name not in V3:
+            return self.send(404, {'title': 'Not found'})
+        if method == 'GET' and id:
+            record = store.get(name, id)
+            if record is None:
+                return self.send(404, {'status': 404, 'title': 'The requested resource was not found.'})
+            return self.send(200, {'data': select_fields(record, params), 'meta': {}})
+        if method == 'GET':
+            limit = min(int(params.get('limit', 50)), self.server.config.max_page_size)
+            records, total = store.list(name, params)
+            page = max(int(params.get('page', 1)), 1)
+            total_pages = -(-total // limit) if total else 0
+            return self.send(200, {'data': [select_fields(r, params) for r in records], 'meta': {'pagination': {
+                'total': total, 'count': len(records), 'per_page': limit, 'current_page': page,
+                'total_pages': total_pages, 'links': {'current': '?page={}&limit={}'.format(page, limit)}}}})
+        if method == 'PUT' and id:
+            record = store.update(name, id, body or {})
+            if record is None:
+                return self.send(404, {'status': 404, 'title': 'The requested resource was not found.'})
+            return self.send(200, {'data': record, 'meta': {}})
+        if method == 'PUT':
+            if not isinstance(body, list) or len(body) > BATCH_LIMIT:
+                return self.send(422, {'status': 422, 'title': 'Batch updates take a list of up to {}'.format(BATCH_LIMIT)})
+            records = [store.update(name, r.get('id'), r) for r in body]
+            if None in records:
+                return self.send(422, {'status': 422, 'title': 'Unknown id in batch'})
+            return self.send(200, {'data': records, 'meta': {}})
+        if method == 'POST' and not id:
+            records = [store.create(name, r) for r in (body if isinstance(body, list) else [body or {}])]
+            return self.send(200, {'data': records if isinstance(body, list) else records[0], 'meta': {}})
+        if method == 'DELETE':
+            store.delete(name, [id] if id else [int(i) for i in params.get('id:in', '').split(',') if i])
+            return self.send(204, None)
+        return self.send(405, {'title': 'Method not allowed'})
+
+    def handle_v2(self, method, path, params, body):
+        store = self.store
+        if path == ['store']:
+            return self.send(200, {'id': 'mock', 'domain': 'mock.example.com', 'name': 'Mock Store', 'secure_url': 'https://mock.example.com'})
+        id = int(path[-1]) if path[-1].isdigit() else None
+        name = '/'.join(path[:-1] if id else path)
+        if name not in V2:
+            return self.send(404, [{'status': 404, 'message': 'The requested resource was not found.'}])
+        if method == 'GET' and id:
+            record = store.get(name, id)
+            return self.send(200, record) if record else self.send(404, [{'status': 404, 'message': 'Not found'}])
+        if method == 'GET':
+            records, total = store.list(name, params)
+            return self.send(200, records) if records else self.send(204, None)
+        if method == 'PUT' and id:
+            record = store.update(name, id, body or {})
+            return self.send(200, record) if record else self.send(404, [{'status': 404, 'message': 'Not found'}])
+        if method == 'POST' and not id:
+            return self.send(201, store.create(name, body or {}))
+        if method == 'DELETE' and id:
+            store.delete(name, [id])
+            return self.send(204, None)
+        return self.send(405, [{'status': 405, 'message': 'Method not allowed'}])
+
+    def send(self, status, obj, count=True, endpoint=None):
+        body = json.dumps(obj).encode() if obj is not None else b''
+        self.send_response(status)
+        if obj is not None:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for k, v in self.rate_headers.items():
+            self.send_header(k, str(v))
+        self.end_headers()
+        self.wfile.write(body)
+        if count:
+            self.server.stats.record(self.command, endpoint or self.endpoint, status, len(body))
+
+
+class Server(ThreadingHTTPServer):
+    request_queue_size = 1024  # the default listen backlog of 5 drops connections from big fan-outs
+    daemon_threads = True
+
+
+def serve(config):
+    server = Server(('127.0.0.1', config.port), Handler)
+    server.config = config
+    server.stores = {}
+    server.stores_lock = threading.Lock()
+    def store(hash):
+        with server.stores_lock:
+            if hash not in server.stores:
+                server.stores[hash] = Store(config, empty=hash in config.empty)
+            return server.stores[hash]
+    server.store = store
+    server.stats = Stats()
+    server.rate_limit = RateLimit(config.quota, config.window)
+    return server
+
+def main():
+    config = get_parser().parse_args()
+    server = serve(config)
+    print('http://127.0.0.1:{}'.format(server.server_port), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
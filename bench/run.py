@@ -0,0 +1,142 @@
+import argparse, json, os, subprocess, sys, tempfile, time, statistics
+from urllib.request import urlopen, Request
+import mock_server
+
+"""
+bench/run.py - times bigcli's main commands against bench/mock_server.py.
+
+Starts the mock server, then runs each scenario as its own bigcli process
+(no cache, fresh ~/.bigcli) and reports wall time, records/sec, peak RSS
+and the requests the server saw. Nothing touches the network.
+
+    python bench/run.py                              # every scenario, 10k products
+    python bench/run.py --products 50000 --latency 30 -w 8
+    python bench/run.py -k iterall --save before.json
+    python bench/run.py --compare before.json        # show the change from a saved run
+"""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name: (bigcli arguments, collection whose size is the record count)
+SCENARIOS = {
+    'iterall-json':     (['a', 'Products', 'iterall', '-o', 'json'], 'products'),
+    'iterall-stream':   (['a', 'Products', 'iterall', '-s', '-o', 'ndjson'], 'products'),
+    'iterall-csv':      (['a', 'Products', 'iterall', '-o', 'csv'], 'products'),
+    'iterall-csv-stream': (['a', 'Products', 'iterall', '-s', '-o', 'csv'], 'products'),
+    'iterall-parquet':  (['a', 'Products', 'iterall', '-s', '-o', 'parquet'], 'products'),
+    'orders-v2':        (['a', 'Orders', 'iterall', '-s', '-o', 'ndjson'], 'orders'),
+    'fix_product_cats': (['t', 'fix_product_cats'], 'products'),
+    'copy':             (['t', 'copy', '--to', 'target'], 'products'),
+}
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='Benchmark bigcli against a local mock BigCommerce API')
+    parser.add_argument('-k', dest='select', metavar='NAME', action='append',
+        help='only run scenarios whose name contains NAME (repeatable)')
+    parser.add_argument('-w', dest='workers', type=int, default=4, help='bigcli -w (default: 4)')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='runs per scenario; the median is reported (default: 3)')
+    parser.add_argument('--save', metavar='FILE', help='write results as json')
+    parser.add_argument('--compare', metavar='FILE', help='show the change from results saved with --save')
+    parser.add_argument('--list', action='store_true', help='list scenarios')
+    parser.add_argument('bigcli_args', nargs='*', help='extra bigcli arguments, after --')
+    for arg in ['products', 'categories', 'customers', 'orders', 'latency', 'jitter', 'quota', 'window', 'error-rate', 'max-page-size']:
+        parser.add_argument('--' + arg, help='passed to mock_server.py')
+    return parser
+
+
+def start_server(args):
+    cmd = [sys.executable, os.path.join(ROOT, 'bench', 'mock_server.py'), '--empty', 'target']
+    for k, v in vars(args).items():
+        if k in ['products', 'categories', 'customers', 'orders', 'latency', 'jitter', 'quota', 'window', 'error_rate', 'max_page_size'] and v is not None:
+            cmd += ['--' + k.replace('_', '-'), v]
+    server = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    return server, server.stdout.readline().strip()
+
+def server_call(origin, path, method='GET'):
+    with urlopen(Request(origin + path, method=method, data=b'' if method == 'POST' else None)) as r:
+        return json.load(r)
+
+def run_bigcli(argv, origin, home):
+    """Runs bigcli in a child process. Returns (exit code, seconds, peak rss in KB)"""
+    env = dict(os.environ, HOME=home, BIGCLI_API_ORIGIN=origin,
+        BIGCLI_STORE_HASH_BENCH='bench', BIGCLI_AUTH_TOKEN_BENCH='bench',
+        BIGCLI_STORE_HASH_TARGET='target', BIGCLI_AUTH_TOKEN_TARGET='target',
+        PYTHONPATH=os.pathsep.join(p for p in [ROOT, os.environ.get('PYTHONPATH')] if p))
+    start = time.perf_counter()
+    child = subprocess.Popen([sys.executable, '-m', 'bigcli.cli'] + argv, cwd=home, env=env,
+        stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    # bigcli reads a request body from stdin when it isn't a terminal
+    child.stdin.write(b'{}')
+    child.stdin.close()
+    stderr = child.stderr.read()
+    _, status, usage = os.wait4(child.pid, 0)
+    seconds = time.perf_counter() - start
+    code = os.waitstatus_to_exitcode(status)
+    child.returncode = code
+    if code:
+        sys.stderr.write(stderr.decode(errors='replace')[-2000:])
+    return code, seconds, usage.ru_maxrss  # KB on linux
+
+def run_scenario(name, args, origin, sizes):
+    argv, collection = SCENARIOS[name]
+    argv = argv + ['-e', 'bench', '--no-cache', '-w', str(args.workers)] + args.bigcli_args
+    runs = []
+    for _ in range(args.repeat):
+        server_call(origin, '/__reset', 'POST')
+        with tempfile.TemporaryDirectory() as home:
+            code, seconds, rss = run_bigcli(argv, origin, home)
+        stats = server_call(origin, '/__stats')
+        if code:
+            return {'name': name, 'error': 'exit code {}'.format(code)}
+        runs.append({'seconds': seconds, 'rss_kb': rss, 'requests': stats['requests'], 'methods': stats['methods']})
+    best = sorted(runs, key=lambda r: r['seconds'])[len(runs) // 2]
+    records = sizes[collection]
+    return dict(best, name=name, records=records, records_per_sec=round(records / best['seconds'], 1),
+        seconds=round(best['seconds'], 3), spread=round(statistics.pstdev(r['seconds'] for r in runs), 3))
+
+def print_results(results, baseline=None):
+    rows = [['scenario', 'records', 'seconds', 'records/s', 'peak rss', 'requests', 'by method']]
+    for r in results:
+        if 'error' in r:
+            rows.append([r['name'], '-', '-', r['error'], '-', '-', '-'])
+            continue
+        rate = '{:.0f}'.format(r['records_per_sec'])
+        rss = '{:.1f}MB'.format(r['rss_kb'] / 1024)
+        before = (baseline or {}).get(r['name'])
+        if before and 'records_per_sec' in before:
+            rate += ' ({:+.0%})'.format(r['records_per_sec'] / before['records_per_sec'] - 1)
+            rss += ' ({:+.0%})'.format(r['rss_kb'] / before['rss_kb'] - 1)
+        methods = ' '.join('{}={}'.format(k, v) for k, v in sorted(r['methods'].items()))
+        rows.append([r['name'], r['records'], '{:.2f}±{:.2f}'.format(r['seconds'], r['spread']), rate, rss, r['requests'], methods])
+    widths = [max(len(str(row[i])) for row in rows) for i in range(len(rows[0]))]
+    for row in rows:
+        print('  '.join(str(v).ljust(w) if i in [0, 6] else str(v).rjust(w) for i, (v, w) in enumerate(zip(row, widths))))
+
+def main():
+    args = get_parser().parse_args()
+    if args.list:
+        print('\n'.join('{:20} bigcli {}'.format(k, ' '.join(v[0])) for k, v in SCENARIOS.items()))
+        return
+    names = [n for n in SCENARIOS if not args.select or any(s in n for s in args.select)]
+    defaults = vars(mock_server.get_parser().parse_args([]))
+    sizes = {k: int(getattr(args, k) or defaults[k]) for k in ['products', 'orders']}
+    server, origin = start_server(args)
+    try:
+        print('[bench] mock api at {}, {} products, {} orders, -w {}'.format(origin, sizes['products'], sizes['orders'], args.workers))
+        results = [run_scenario(name, args, origin, sizes) for name in names]
+    finally:
+        server.terminate()
+        server.wait()
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {r['name']: r for r in json.load(f)['results']}
+    print_results(results, baseline)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'config': {k: v for k, v in vars(args).items() if k not in ['save', 'compare', 'list']},
+                'python': sys.version.split()[0], 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}, f, indent=4)
+
+if __name__ == '__main__':
+    main()
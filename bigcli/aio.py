@@ -0,0 +1,220 @@
+"""
+bigcli.aio - the --engine async request engine.
+
+Fans GET requests out from one asyncio event loop over a shared httpx
+connection pool, instead of from one thread per request, so a single
+process can keep hundreds of requests in flight. The api calls themselves
+still go through the bigcommerce client: a call is run once to capture the
+request it would send, the request is sent on the loop, and the call is run
+again with the response, which the client parses as it always does. Rate
+limiting, retries, the response cache and stats are the store's
+SchedulingAdapter's, as on the sync path.
+"""
+import asyncio, atexit, itertools, ssl, threading, time
+from collections import deque
+from concurrent.futures import Future
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from bigcli import session
+
+_engine = None
+_engine_lock = threading.Lock()
+
+class Deferred(BaseException):
+    """
+    Raised instead of sending a request while a call is being captured. A
+    BaseException, so the call's own `except Exception` handlers let it by.
+    """
+
+    def __init__(self, session, request, timeout):
+        self.session = session
+        self.request = request
+        self.timeout = timeout
+
+
+class DeferringSession():
+    """
+    Stands in for a connection's requests session. Requests go to the real
+    session, except in a thread that's capturing or replaying a call.
+    """
+
+    def __init__(self, session, local):
+        self.session = session
+        self.local = local
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    def request(self, method, url, data=None, headers=None, timeout=None, **kwargs):
+        mode = getattr(self.local, 'mode', None)
+        if mode == 'capture':
+            if method != 'GET':
+                raise RuntimeError('the async engine only fans out GET requests')
+            request = self.session.prepare_request(requests.Request(method, url, data=data, headers=headers))
+            raise Deferred(self.session, request, timeout)
+        if mode == 'replay':
+            self.local.mode = None
+            return self.local.response
+        return self.session.request(method, url, data=data, headers=headers, timeout=timeout, **kwargs)
+
+
+class AsyncEngine():
+    """
+    Runs an event loop in a background thread. map() captures calls in the
+    caller's thread and replays them there, so results (and exceptions) come
+    back exactly as the sync client would give them.
+    """
+
+    # httpx's pool slows down as it grows, so connections are spread over small pools
+    pool_size = 4
+
+    def __init__(self, concurrency=100):
+        import httpx
+        self.httpx = httpx
+        self.concurrency = concurrency
+        self.local = threading.local()
+        self.clients = []
+        self.busy = []
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='bigcli-aio', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def attach(self, client):
+        """Routes the GETs of calls made through map() on a BigcommerceApi client's connections to the loop"""
+        for connection in session.connections(client):
+            if not isinstance(connection._session, DeferringSession):
+                connection._session = DeferringSession(connection._session, self.local)
+            connection.bigcli_engine = self
+        return client
+
+    def map(self, fn, items):
+        """
+        Like concurrent_map(fn, items) for an fn that makes one GET request:
+        yields fn(item) for each item in order, with up to `concurrency`
+        requests in flight. fn runs twice per item, so it shouldn't have
+        side effects before its request.
+        """
+        pending = deque()
+        try:
+            for item in items:
+                pending.append((item, self.start(fn, item)))
+                if len(pending) >= self.concurrency:
+                    yield self.finish(fn, *pending.popleft())
+            while pending:
+                yield self.finish(fn, *pending.popleft())
+        finally:
+            for item, future in pending:
+                future.cancel()
+
+    def start(self, fn, item):
+        """Captures fn(item)'s request and starts sending it. Returns a future of the response."""
+        self.local.mode = 'capture'
+        try:
+            result = fn(item)
+        except Deferred as d:
+            return asyncio.run_coroutine_threadsafe(self.send(d.session, d.request, d.timeout), self.loop)
+        finally:
+            self.local.mode = None
+        # fn returned without making a request
+        future = Future()
+        future.set_result(result)
+        future.done_without_request = True
+        return future
+
+    def finish(self, fn, item, future):
+        """Replays fn(item) with the response its request got"""
+        if getattr(future, 'done_without_request', False):
+            return future.result()
+        self.local.mode, self.local.response = 'replay', future.result()
+        try:
+            return fn(item)
+        finally:
+            self.local.mode, self.local.response = None, None
+
+    async def send(self, http_session, request, timeout):
+        """Sends request the way the store's SchedulingAdapter would, and returns a requests.Response"""
+        adapter = http_session.get_adapter(request.url)
+        cached, response = adapter.before_send(request)
+        if response is not None:
+            return response
+        for attempt in itertools.count():
+            wait = await acquire(adapter.limiter)
+            start = time.monotonic()
+            i = self.pick_client()
+            try:
+                self.busy[i] += 1
+                r = await self.clients[i].request(request.method, request.url, headers=dict(request.headers),
+                    content=request.body, timeout=timeout)
+            except self.httpx.TransportError as e:
+                session.stats.request(request, time.monotonic() - start, wait, attempt=attempt)
+                if not adapter.should_retry(request, attempt, error=e):
+                    raise requests.exceptions.ConnectionError(e, request=request)
+                delay = adapter.backoff_delay(attempt)
+            else:
+                response = to_response(request, r)
+                session.stats.request(request, time.monotonic() - start, wait, response, len(r.content), attempt)
+                adapter.limiter.update(response.headers, response.status_code)
+                if not adapter.should_retry(request, attempt, response):
+                    return adapter.after_send(request, cached, response)
+                delay = adapter.backoff_delay(attempt, response)
+            finally:
+                self.busy[i] -= 1
+            session.stats.retry(request, delay)
+            await asyncio.sleep(delay)
+
+    def pick_client(self):
+        """Returns the index of the least busy httpx client, creating them on first use (on the loop)"""
+        if not self.clients:
+            import certifi
+            limits = self.httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+            context = ssl.create_default_context(cafile=certifi.where())
+            self.clients = [self.httpx.AsyncClient(limits=limits, verify=context)
+                            for _ in range(-(-self.concurrency // self.pool_size))]
+            self.busy = [0] * len(self.clients)
+        return self.busy.index(min(self.busy))
+
+    async def aclose(self):
+        for client in self.clients:
+            await client.aclose()
+        self.clients = []
+
+    def close(self):
+        if self.clients and self.loop.is_running():
+            asyncio.run_coroutine_threadsafe(self.aclose(), self.loop).result(timeout=5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+async def acquire(limiter):
+    """RateLimiter.acquire without blocking the loop. Returns seconds spent waiting."""
+    start = time.monotonic()
+    while True:
+        wait = limiter.take()
+        if wait <= 0:
+            return time.monotonic() - start
+        await asyncio.sleep(wait)
+
+def to_response(request, r):
+    """Copies an httpx response into the requests.Response the bigcommerce client expects"""
+    response = requests.Response()
+    response.status_code = r.status_code
+    response.reason = r.reason_phrase
+    response.headers = CaseInsensitiveDict(r.headers.items())
+    response.encoding = get_encoding_from_headers(response.headers)
+    response._content = r.content
+    response.url = str(r.url)
+    response.request = request
+    return response
+
+def engine(concurrency=100):
+    """
+    Returns the process's AsyncEngine, so every client shares one loop and
+    connection pool. The engine is made by the first call, so its
+    concurrency is that call's; later calls get it as it is.
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = AsyncEngine(concurrency)
+        return _engine
@@ -1,10 +1,11 @@
-import inspect, sys, os, platform, argparse, json, getpass, csv
-import bigcommerce
+import inspect, sys, os, io, re, platform, argparse, json, getpass, csv, shutil, itertools, time, functools, threading, copy, hashlib, tempfile, gzip, glob
+import email.utils
 from dotenv import dotenv_values
 from pathlib import Path
-from bigcommerce.api import BigcommerceApi
-from bigcommerce.resources.base import *
 from inspect import isclass
+from collections import deque
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
 
 """
 bigcli - Interact with BigCommerce stores via command line.
@@ -15,9 +16,41 @@ Author: https://github.com/aglensmith
 def main():
     parser = get_parser()
     args = parser.parse_args()
-    args.func(args, parser)
+    if args.func not in [cli, env, files]:
+        load_bigcommerce()
+        session.stats.trace = bool(getattr(args, 'profile_trace', None))
+    try:
+        if getattr(args, 'stores', None) or getattr(args, 'all_stores', False):
+            fan_out(args, parser)
+        else:
+            args.func(args, parser)
+    finally:
+        if 'session' in globals() and (getattr(args, 'profile', False) or getattr(args, 'profile_trace', None)):
+            print_profile(args.profile_trace)
+        elif 'session' in globals() and session.stats.retries:
+            print('[bigcli] ' + session.stats.summary(), file=sys.stderr)
+
+def load_bigcommerce():
+    """
+    Imports bigcommerce (and with it requests) on first use, so commands that
+    don't call the API start without loading them.
+    """
+    global bigcommerce, BigcommerceApi, session
+    global ApiResource, ApiSubResource, ApiSubSubResource, CreateableApiResource, UpdateableApiResource
+    global CollectionUpdateableApiResource, ListableApiResource, ListableApiSubResource, ListableApiSubSubResource
+    if 'bigcommerce' in globals():
+        return
+    import bigcommerce
+    from bigcommerce.api import BigcommerceApi
+    from bigcommerce.resources.base import (ApiResource, ApiSubResource, ApiSubSubResource, CreateableApiResource,
+        UpdateableApiResource, CollectionUpdateableApiResource, ListableApiResource, ListableApiSubResource,
+        ListableApiSubSubResource)
+    from bigcli import session
+    Resources.load()
 
 # Argument parsers ############################################################
+OUT_FORMATS = ['json', 'ndjson', 'csv', 'tsv', 'parquet', 'feather', 'snapshot', 'txt', 'html']
+
 def get_parser():
     prog             = 'bigcli'
     desc             = 'Interact with BigCommerce stores via command line'
@@ -26,21 +59,49 @@ def get_parser():
     tasks_help       = 'run miscellaneous pre-programmed tasks'
     file_help        = 'list .bigcli files'
     resource_help    = 'An API resource (run bigcli a -l to see all)'
-    ids_help         = 'specify resource IDs for path'
+    ids_help         = 'specify resource IDs for path; get takes any number of leaf ids'
+    ids_from_help    = 'get every id listed in path (one per line or comma separated, - for stdin)'
     creds_help       = 'get prompted for api credentials'
     list_help        = 'list available api resources'
     pretty_help      = 'minify json output'
-    out_help         = 'specify outfile'
+    out_help         = 'specify outfile, or a format saved to ~/.bigcli: ' + ', '.join(OUT_FORMATS)
     in_help          = 'specify file path to request body json'
     method_help      = 'get, all, update, or delete'
     data_help        = 'include json data for request body'
     methods          = ['get', 'all', 'iterall', 'delete', 'create', 'update']
     fil_o_help       = 'open all .bigcli files'
+    prune_help       = 'delete old -o snapshot output (see --keep and --older-than)'
+    keep_help        = 'snapshots to keep per store, resource and method when pruning (default: 5)'
+    older_than_help  = 'also prune snapshots older than DAYS'
     widgets_help     = 'interact with store widgets'
     themes_help      = 'interact with store themes'
     settings_help    = 'interact with store settings'
     env_help         = 'create or open ~/.bigcli/.env'
-    resources        = Resources.all
+    stream_help      = 'write records as they arrive (ndjson, or csv/tsv with -o csv)'
+    workers_help     = 'max concurrent requests (default: 4)'
+    no_cache_help    = 'don\'t read or write the response cache'
+    refresh_help     = 'ignore cached responses, but cache the new ones'
+    cache_ttl_help   = 'seconds a cached response is fresh (default: 60)'
+    resume_help      = 'continue an interrupted iterall -s or task from its last finished page'
+    retries_help     = 'times to retry timeouts, 429s and 5xx responses (default: 5)'
+    engine_help      = 'sync (default), or async to fan page and multi-id fetches out from one event loop (needs httpx)'
+    profile_help     = 'print request timings per endpoint'
+    trace_help       = 'print request timings per endpoint, and write them with a json trace of every request to FILE'
+    sync_help        = 'mirror store resources into ~/.bigcli/<hash>/sync.db'
+    sync_res_help    = 'resources to sync (default: {})'.format(', '.join(SYNC_FILTERS))
+    full_help        = 'ignore the last sync and pull every record'
+    stores_help      = 'run the command on each of these .env suffixes at once'
+    all_stores_help  = 'run the command on every store configured in .env files'
+    bulk_help        = 'create or update many records from a json array or ndjson input'
+    batch_help       = 'records per batch update request with --bulk (default: 10)'
+    fields_help      = 'only output these fields, ex: id,sku,custom_url.url'
+    diff_help        = 'show records added, removed or changed between two stores or a store and a saved snapshot'
+    against_help     = 'the .env suffix of the store to compare the -e store with'
+    snapshot_help    = 'compare the live store with a saved output file or snapshot (default: the newest all/iterall one for resource)'
+    key_help         = 'field that identifies a record on both sides (default: id)'
+    to_help          = 'the .env suffix of the store copy writes to (ex: PROD)'
+    where_help       = 'only output records matching EXPR, ex: \'inventory_level<5\' (repeatable)'
+    resources        = Resources.names()
 
     __parser   = argparse.ArgumentParser(prog=prog, description=desc, epilog=epi)
     __parser.set_defaults(func=cli)
@@ -58,12 +119,29 @@ def get_parser():
     # output options
     out_group = _shr.add_argument_group('output options')
     out_group.add_argument('-m', '--minify', dest='pretty_print', action='store_false', help=pretty_help)
-    out_group.add_argument('-o', dest='out', nargs='?', type=argparse.FileType('w'), default=sys.stdout, help=out_help)
+    out_group.add_argument('-o', dest='out', metavar='FILE|FORMAT', nargs='?', default='-', help=out_help)
+    out_group.add_argument('-s', '--stream', dest='stream', action='store_true', help=stream_help)
+    out_group.add_argument('--fields', dest='fields', metavar='FIELDS', type=field_list, default=[], help=fields_help)
+    out_group.add_argument('--where', dest='where', metavar='EXPR', type=predicate, action='append', default=[], help=where_help)
+
+    # performance options
+    perf_group = _shr.add_argument_group('performance options')
+    perf_group.add_argument('-w', dest='workers', metavar='WORKERS', type=int, default=4, help=workers_help)
+    perf_group.add_argument('--no-cache', dest='no_cache', action='store_true', help=no_cache_help)
+    perf_group.add_argument('--refresh', dest='refresh', action='store_true', help=refresh_help)
+    perf_group.add_argument('--cache-ttl', dest='cache_ttl', metavar='SECONDS', type=int, default=60, help=cache_ttl_help)
+    perf_group.add_argument('--resume', dest='resume', action='store_true', help=resume_help)
+    perf_group.add_argument('--retries', dest='retries', metavar='N', type=int, default=5, help=retries_help)
+    perf_group.add_argument('--engine', dest='engine', choices=['sync', 'async'], default='sync', help=engine_help)
+    perf_group.add_argument('--profile', dest='profile', action='store_true', help=profile_help)
+    perf_group.add_argument('--profile-trace', dest='profile_trace', metavar='FILE', help=trace_help)
 
     # credentials options
     cred_group = _shr.add_argument_group('credentials options')
     cred_group.add_argument('-c', '--creds', dest='prompt_for_creds', action='store_true', help=creds_help)
     cred_group.add_argument('-e', dest='env', metavar='SUFFIX', default='dev', help='specify .env suffix (ex: PROD)')
+    cred_group.add_argument('--stores', dest='stores', metavar='SUFFIX', nargs='+', help=stores_help)
+    cred_group.add_argument('--all-stores', dest='all_stores', action='store_true', help=all_stores_help)
 
     # task only arguments
     tsk_group = _subs.add_argument_group('task options')
@@ -79,6 +157,8 @@ def get_parser():
     _tsk = subs.add_parser('task',  aliases=['t'], help=tasks_help, parents=[_shr, _subs])
     _thm = subs.add_parser('themes', aliases=['th'], help=themes_help, parents=[_shr, _subs])
     _wdg = subs.add_parser('widgets', aliases=['w'], help=widgets_help, parents=[_shr, _subs])
+    _syn = subs.add_parser('sync',  aliases=['y'], help=sync_help, parents=[_shr])
+    _dif = subs.add_parser('diff',  aliases=['d'], help=diff_help, parents=[_shr])
 
     # default functions
     _env.set_defaults(func=env)
@@ -88,6 +168,8 @@ def get_parser():
     _tsk.set_defaults(func=Tasks.default)
     _wdg.set_defaults(func=Widgets.default)
     _thm.set_defaults(func=Themes.default)
+    _syn.set_defaults(func=sync, task='sync')
+    _dif.set_defaults(func=diff, method='diff')
 
     _api.add_argument('-l', '--list', dest='list', help=list_help, action='store_true')
 
@@ -96,13 +178,26 @@ def get_parser():
     req_group.add_argument('resource', nargs='?', metavar='resource', choices=resources, help=resource_help)
     req_group.add_argument('method', metavar='method', nargs='?', choices=methods, default='get', help=method_help)
     req_group.add_argument('-i', dest='ids', metavar='id', nargs='*', default=[], help=ids_help)
+    req_group.add_argument('--ids-from', dest='ids_from', metavar='path', type=argparse.FileType('r'), help=ids_from_help)
+    req_group.add_argument('-b', '--bulk', dest='bulk', action='store_true', help=bulk_help)
+    req_group.add_argument('--batch', dest='batch_size', metavar='SIZE', type=int, default=10, help=batch_help)
 
     # subcommand only orguments
     _fil.add_argument('-o', action='store_true', help=fil_o_help)
+    _fil.add_argument('--prune', dest='prune', action='store_true', help=prune_help)
+    _fil.add_argument('--keep', dest='keep', metavar='N', type=int, default=5, help=keep_help)
+    _fil.add_argument('--older-than', dest='older_than', metavar='DAYS', type=float, help=older_than_help)
     _tsk.add_argument('task', nargs='?',  choices=Tasks._all())
+    _tsk.add_argument('--to', dest='to', metavar='SUFFIX', help=to_help)
     _wdg.add_argument('task', nargs='?',  choices=Widgets._all())
     _set.add_argument('task', nargs='?',  choices=Settings._all())
     _thm.add_argument('task', nargs='?',  choices=Themes._all())
+    _syn.add_argument('resources', nargs='*', metavar='resource', help=sync_res_help)
+    _syn.add_argument('--full', dest='full', action='store_true', help=full_help)
+    _dif.add_argument('resource', choices=resources, help=resource_help)
+    _dif.add_argument('--against', dest='against', metavar='SUFFIX', help=against_help)
+    _dif.add_argument('--snapshot', dest='snapshot', metavar='PATH', nargs='?', const=True, help=snapshot_help)
+    _dif.add_argument('--key', dest='key', metavar='FIELD', default='id', help=key_help)
     return __parser
 
 # Argument parser functions ###################################################
@@ -112,26 +207,140 @@ def cli(args, parser):
 def api(args, parser):
     if args.list:
         return list_api_resources()
+    if args.bulk:
+        return bulk(args, parser)
     if args.data:
         in_data = json.loads(args.data)
     else:
         in_data = {}
         for p in args.params:
             in_data[p.split('=')[0]] = tryParseInt(p.split('=')[1])
-    if args.data and args.instream and not args.instream.isatty():
-        in_data = json.load(args.instream)
-    if not args.data and (args.instream and not args.instream.isatty()):
-        in_data = json.load(args.instream)
+    body = args.body if 'body' in args else read_body(args)
+    if body is not None:
+        in_data = body
     if not args.resource:
         return parser.parse_args(['api', '--help'])    
-    if not validate_ids(Resources.all_dict[args.resource], args.resource, args.ids):
+    cls = Resources.all_dict[args.resource]
+    depth = id_depth(cls)
+    multi = args.method == 'get' and (args.ids_from or len(args.ids) > depth + 1)
+    ids = args.ids[depth:] + (read_ids(args.ids_from) if args.ids_from else []) if multi else args.ids
+    if not validate_ids(cls, args.resource, args.ids[:depth] + ids[:1] if multi else ids):
         return
+    if args.resume and args.method == 'iterall' and not resumable(args, cls, in_data):
+        print('[bigcli] --resume works with iterall -s written to stdout or -o ndjson. Ex: bigcli a Products iterall -s -o ndjson --resume')
+        return
+    if args.method in ['get', 'all', 'iterall'] and type(in_data) is dict:
+        in_data.update(pushdown(args.resource, args.method, args.fields, args.where, in_data))
     try:
-        out_data = do_api_request(args, args.resource, args.method, args.ids, in_data)
+        if multi:
+            out_data = multi_get(args, args.resource, args.ids[:depth], ids, **in_data)
+        else:
+            out_data = do_api_request(args, args.resource, args.method, ids, in_data)
         output(args, out_data, hash=get_store_hash(args, prompt=False))
-    except bigcommerce.exception.ClientRequestException as e:
+    except (bigcommerce.exception.HttpException, session.RequestException) as e:
         handleBigCommerceClientRequestException(e)
 
+def bulk(args, parser):
+    if not args.resource or args.method not in ['create', 'update']:
+        print('[bigcli] --bulk works with create or update. Ex: bigcli a Products update -b -in products.json')
+        return
+    if not validate_ids(Resources.all_dict[args.resource], args.resource, args.ids):
+        return
+    body = args.body if 'body' in args else read_body(args)
+    if args.data:
+        records = json.loads(args.data)
+        records = records if type(records) is list else [records]
+    elif body is not None:
+        records = body
+    else:
+        print('[bigcli] --bulk needs records from -d, -in [path], or stdin')
+        return
+    try:
+        report = bulk_write(args, args.resource, args.method, args.ids, records, args.batch_size)
+        output(args, report, hash=get_store_hash(args, prompt=False))
+    except (bigcommerce.exception.HttpException, session.RequestException) as e:
+        handleBigCommerceClientRequestException(e)
+
+def read_body(args):
+    """
+    Returns the request body from -in [path] or piped stdin: a generator of
+    records for --bulk, else one json document. None if there isn't one.
+    """
+    if not args.instream or args.instream.isatty() or args.instream is getattr(args, 'ids_from', None):
+        return None
+    if getattr(args, 'bulk', False):
+        return iterjson(args.instream)
+    text = args.instream.read()
+    return json.loads(text) if text.strip() else None
+
+def sync(args, parser):
+    unknown = [r for r in args.resources if r not in SYNC_FILTERS]
+    if unknown:
+        parser.error('can\'t sync {} (choose from {})'.format(', '.join(unknown), ', '.join(SYNC_FILTERS)))
+    hash = get_store_hash(args)
+    api = init_api_client(args)
+    make_tmp_dirs_if_not_exist(hash)
+    import sqlite3
+    db = sqlite3.connect(tmp_path(hash) + '/sync.db')
+    db.execute('CREATE TABLE IF NOT EXISTS watermarks (resource TEXT PRIMARY KEY, date_modified TEXT, synced_at TEXT)')
+    summary = {}
+    for resource in args.resources or list(SYNC_FILTERS):
+        summary[resource] = sync_resource(args, api, db, resource)
+    db.close()
+    output(args, summary, hash)
+
+def fan_out(args, parser):
+    """
+    Runs the command against each store in --stores (or every configured
+    store) at once. Each store writes its output to ~/.bigcli/<hash>/ under
+    its own rate limit, and a merged summary goes to ~/.bigcli/_stores.json.
+    """
+    suffixes = store_suffixes() if args.all_stores else args.stores
+    # stdin can only be read once, so the body and ids are read here and each store gets a copy
+    body, ids_from = None, None
+    if args.func is api:
+        body = read_body(args)
+        body = list(body) if inspect.isgenerator(body) else body
+        ids_from = args.ids_from.read() if args.ids_from else None
+    runs = {}
+    for suffix in suffixes:
+        store_args = copy.copy(args)
+        store_args.env = suffix
+        store_args.stores, store_args.all_stores = None, False
+        store_args.params, store_args.ids = list(args.params), list(getattr(args, 'ids', []))
+        store_args.per_store_output = True
+        if args.func is api:
+            store_args.body = copy.deepcopy(body)
+            store_args.ids_from = io.StringIO(ids_from) if ids_from is not None else None
+        if args.out and args.out not in OUT_FORMATS:
+            store_args.out = None
+        store_args.store_hash = get_store_hash(store_args)
+        runs[suffix] = store_args
+
+    def run(suffix):
+        store_args = runs[suffix]
+        start = time.monotonic()
+        summary = {'store_hash': store_args.store_hash, 'ok': True}
+        try:
+            store_args.func(store_args, parser)
+            summary['output'] = getattr(store_args, 'output_path', None)
+        except SystemExit as e:
+            if e.code:
+                summary.update(ok=False, error='exited with {}'.format(e.code))
+        except Exception as e:
+            summary.update(ok=False, error='{}: {}'.format(type(e).__name__, e))
+        summary['seconds'] = round(time.monotonic() - start, 2)
+        print('[bigcli] {} ({}): {} in {}s'.format(suffix, store_args.store_hash,
+            'done' if summary['ok'] else 'failed', summary['seconds']), file=sys.stderr)
+        return summary
+
+    with ThreadPoolExecutor(max_workers=max(len(runs), 1)) as pool:
+        summaries = dict(zip(runs, pool.map(run, runs)))
+    make_tmp_dirs_if_not_exist()
+    with open(tmp_path() + '/' + '_stores.json', 'w') as f:
+        json.dump(summaries, f, indent=4)
+    print(json.dumps(summaries, indent=4))
+
 def env(args, parser):
     make_tmp_dirs_if_not_exist()
     print(not os.path.exists(dot_env_path()))
@@ -142,7 +351,10 @@ def env(args, parser):
     open_env()
 
 def files(args, parser): 
-    if args.o and tmp_path_exists():
+    if args.prune:
+        for path in prune_snapshots(args.keep, args.older_than):
+            print('[bigcli] removed {}'.format(path))
+    elif args.o and tmp_path_exists():
         open_files_using_default_editor()
     else:
         list_files()
@@ -161,8 +373,7 @@ class SubCommand():
                 print("{} {} {}".format(color(k, 'blue'), " " * (30-len(k)), v.__doc__))
             return
         hash = get_store_hash(args)
-        token = get_auth_token(args)
-        client = BigcommerceApi(store_hash=hash, access_token=token, version='latest')
+        client = init_api_client(args)
         out_data = cls._all()[args.task](args, client)
         if out_data:
             output(args, out_data, hash)
@@ -182,13 +393,14 @@ class Settings(SubCommand):
     def all(args, api):
         """list all store settings"""
         settings = {}
-        for r in Resources.classes:
-            if r and "Settings" in r.__name__:
-                if isUpdateable(r) and not (islistable(r) or isCreatable(r)):
-                    print(r.__name__)
-                    Settings.pretty_print_key_values(getattr(api, r.__name__).get().__json__())
-                    settings.update(getattr(api, r.__name__).get().__json__())
-                    print("")
+        fetch = fetcher(api, args.workers)
+        futures = [(r.__name__, fetch.submit(r.__name__, 'get')) for r in Resources.classes
+            if r and "Settings" in r.__name__ and isUpdateable(r) and not (islistable(r) or isCreatable(r))]
+        for name, future in futures:
+            print(name)
+            Settings.pretty_print_key_values(future.result().__json__())
+            settings.update(future.result().__json__())
+            print("")
 
     def logo(args, api):
         """List logo settings"""
@@ -215,54 +427,122 @@ class Themes(SubCommand):
 
     def cleanup(args, api):
         """delete all inactive themes"""
-        if confirm(api, 'themes'):
-            themes = api.Themes.all()
-            for t in themes:
-                if not t['is_active']:
-                    print('[brocli]: deleting theme {} {}'.format(t.name, t.uuid))
-                    try:
-                        t.delete()
-                    except bigcommerce.exception.ClientRequestException as e:
-                        handleBigCommerceClientRequestException(e)
+        fetch = fetcher(api, args.workers)
+        fetch.submit('Store', 'get')  # for the confirmation, fetched alongside the themes
+        themes = [t for t in fetch.submit('Themes', 'all').result() if not t['is_active']]
+        if not themes:
+            print('[bigcli]: no inactive themes to delete.')
+            return
+        for t in themes:
+            print('  {}  {}'.format(t.uuid, t.name))
+        if args.dry:
+            return {'dry_run': True, 'would_delete': {t.uuid: t.name for t in themes}}
+        if not confirm_count(api, 'inactive themes', len(themes)):
+            return
+
+        def delete(t):
+            try:
+                t.delete()
+                return t, None
+            except (bigcommerce.exception.HttpException, session.RequestException) as e:
+                return t, e
+
+        report = {'deleted': {}, 'failed': {}}
+        for t, e in concurrent_map(delete, themes, args.workers):
+            if e is None:
+                report['deleted'][t.uuid] = t.name
+                print('[bigcli]: deleted theme {} {}'.format(t.name, t.uuid))
+            else:
+                report['failed'][t.uuid] = {'name': t.name, 'error': str(e)}
+                print('[bigcli]: failed to delete theme {} {}: {}'.format(t.name, t.uuid, e), file=sys.stderr)
+        print('[bigcli]: {} deleted, {} failed'.format(len(report['deleted']), len(report['failed'])), file=sys.stderr)
+        return report
 
     def delete(args, api):
+        """delete a theme (-p UUID, or pick one from the list)"""
+        fetcher(api, args.workers).submit('Store', 'get')  # for the confirmation
         if len(args.params) < 1:
             args.pretty_print = True
             output(args, Themes.list(args, api))
-            uuid = input ('\n [bigcli] UUID: ')
-            args.params.append(uuid)
-
-        if confirm(api, uuid):
-            api.Themes.get(args.params[0]).delete()
+            args.params.append(input('\n [bigcli] UUID: '))
+        uuid = args.params[0]
+        if confirm(api, 'Themes', [uuid]):
+            api.Themes.get(uuid).delete()
 
 
 class Tasks(SubCommand):
     
     def list_cat_ids(args, api):
         """list all category IDs"""
-        categories = api.Categories.iterall()
+        categories = iterall_concurrent(api.Categories, [], args.workers)
         category_ids = [c.id for c in categories]
         return category_ids
 
     def fix_product_cats(args, api):
         """Removes deleted category IDs in the categories array of all products."""
-        all_cat_ids = Tasks.list_cat_ids(args, api)
-        products_updated = []
-        deleted_cat_ids = []
-        i = 1
-        for p in api.Products.iterall():
-            new_p_cats = [c for c in p.categories] 
-            for catid in p.categories:
-                if catid not in all_cat_ids:
-                    deleted_cat_ids.append(catid)           
-                    new_p_cats.remove(catid)
-            if len(p.categories) > len(new_p_cats):
-                products_updated.append({p.id: {'before': p.categories, 'after': new_p_cats}})
-                if not args.dry:
-                    p.update(categories=new_p_cats)
-            print_req_info("Products", p, i, f"Deleted cats found: {len(deleted_cat_ids)} in {len(products_updated)} products")
-            i += 1
-        return {'nonexistent_cats': deleted_cat_ids, 'products': products_updated}
+        all_cat_ids = set(Tasks.list_cat_ids(args, api))
+        checkpoint = Checkpoint(get_store_hash(args), 'fix_product_cats', {'dry': args.dry})
+        state = checkpoint.load() if args.resume else {}
+        deleted_cat_ids = set(state.get('nonexistent_cats', []))
+        report = state.get('stats', {'written': 0, 'failed': 0, 'scanned': 0, 'updated': 0})
+        pages = iterpages(api.Products, [], args.workers, state.get('page', 0) + 1, include_fields='categories')
+        start = time.monotonic()
+        scanned = 0
+        dumps = json_encoder()[1]
+
+        # each page's changes and errors are appended to a log, so the checkpoint stays small
+        log_path = checkpoint.path[:-len('.json')] + '.log.ndjson'
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        with open(log_path, 'r+b' if state.get('output') == log_path else 'w+b') as log:
+            checkpoint.attach(log)
+            try:
+                for page, products in pages:
+                    updates = []
+                    for p in products:
+                        new_p_cats = [c for c in p.categories if c in all_cat_ids]
+                        if len(p.categories) > len(new_p_cats):
+                            deleted_cat_ids.update(c for c in p.categories if c not in all_cat_ids)
+                            log.write(dumps({'product': {p.id: {'before': p.categories, 'after': new_p_cats}}}) + b'\n')
+                            updates.append({'id': p.id, 'categories': new_p_cats})
+                    if updates and not args.dry:
+                        written = bulk_write(args, 'Products', 'update', [], updates, progress=False)
+                        report['written'] += written['written']
+                        report['failed'] += written['failed']
+                        log.writelines(dumps({'error': e}) + b'\n' for e in written['errors'])
+                    scanned += len(products)
+                    report['scanned'] += len(products)
+                    report['updated'] += len(updates)
+                    checkpoint.save(page=page, nonexistent_cats=sorted(deleted_cat_ids), stats=report)
+                    rate = scanned / max(time.monotonic() - start, 0.001)
+                    print_progress(f"[bigcli] Products scanned: {report['scanned']} ({rate:.0f}/s) | Deleted cats found: {len(deleted_cat_ids)} in {report['updated']} products")
+            except (Exception, KeyboardInterrupt):
+                print_resume_hint(checkpoint)
+                raise
+            print('', file=sys.stderr)
+            log.seek(0)
+            entries = [json.loads(line) for line in log]
+        checkpoint.clear()
+        os.remove(log_path)
+
+        products_updated = [e['product'] for e in entries if 'product' in e]
+        seconds = time.monotonic() - start
+        stats = {'written': report['written'], 'failed': report['failed'], 'errors': [e['error'] for e in entries if 'error' in e],
+            'scanned': report['scanned'], 'dry_run': args.dry, 'seconds': round(seconds, 2),
+            'products_per_sec': round(scanned / max(seconds, 0.001), 1)}
+        return {'nonexistent_cats': sorted(deleted_cat_ids), 'products': products_updated, 'stats': stats}
+
+
+    def copy(args, api):
+        """copy categories, brands and products to the --to store, remapping ids | Ex: bigcli t copy -e DEV --to PROD"""
+        if not args.to:
+            print('[bigcli] copy needs a target store. Ex: bigcli t copy -e DEV --to PROD')
+            return
+        target_args = copy.copy(args)
+        target_args.env = args.to
+        if get_store_hash(target_args) == get_store_hash(args):
+            print('[bigcli] --to {} is the store being copied'.format(args.to))
+            return
+        return copy_catalog(args, api, target_args, init_api_client(target_args))
 
 
 class Widgets(SubCommand):
@@ -300,9 +580,9 @@ class Widgets(SubCommand):
         ]
         if len(args.params) > 0:
             templates = args.params
-        regions = {}
-        for t in templates:
-            regions[t] = [r.name for r in api.WidgetRegions.all(template_file=t) if 'name' in r]
+        fetch = fetcher(api, args.workers)
+        futures = {t: fetch.submit('WidgetRegions', 'all', template_file=t) for t in templates}
+        regions = {t: [r.name for r in f.result() if 'name' in r] for t, f in futures.items()}
         for k,v in regions.items():
             print(k)
             for i in v:
@@ -310,15 +590,767 @@ class Widgets(SubCommand):
             print('')
 
 
+# Sync ########################################################################
+
+# resource: date_modified filter param, or None to pull every record each sync
+SYNC_FILTERS = {
+    'Products': 'date_modified:min',
+    'Categories': None,
+    'Customers': 'date_modified:min',
+    'Orders': 'min_date_modified',
+}
+
+def sync_resource(args, api, db, resource):
+    """
+    Upserts records changed since the resource's date_modified watermark into
+    its table in db. Resources without a date filter (or --full) are pulled in
+    full, and rows that no longer exist in the store are removed.
+    """
+    db.execute('CREATE TABLE IF NOT EXISTS {} (id INTEGER PRIMARY KEY, date_modified TEXT, data TEXT)'.format(resource))
+    row = db.execute('SELECT date_modified FROM watermarks WHERE resource = ?', (resource,)).fetchone()
+    watermark = row[0] if row else None
+    full = args.full or not SYNC_FILTERS[resource] or not watermark
+    params = {} if full else {SYNC_FILTERS[resource]: watermark}
+
+    cls = Resources.all_dict[resource]
+    res = getattr(api, resource)
+    if can_fetch_pages_concurrently(args, cls, params):
+        records = iterall_concurrent(res, [], args.workers, **params)
+    else:
+        records = res.iterall(**params)
+
+    if full:
+        db.execute('CREATE TEMP TABLE IF NOT EXISTS seen (id INTEGER PRIMARY KEY)')
+        db.execute('DELETE FROM seen')
+    fetched = 0
+    for batch in chunks(iterrecords(records), 500):
+        rows = []
+        for r in batch:
+            modified = iso_date(r.get('date_modified'))
+            if modified and (not watermark or modified > watermark):
+                watermark = modified
+            rows.append((r['id'], modified, json.dumps(r)))
+        with db:
+            db.executemany('INSERT OR REPLACE INTO {} VALUES (?, ?, ?)'.format(resource), rows)
+            if full:
+                db.executemany('INSERT OR IGNORE INTO seen VALUES (?)', [(r[0],) for r in rows])
+        fetched += len(batch)
+        print_progress('[bigcli] {} synced: {}'.format(resource, fetched))
+    print('', file=sys.stderr)
+
+    with db:
+        if full:
+            db.execute('DELETE FROM {} WHERE id NOT IN (SELECT id FROM seen)'.format(resource))
+        db.execute('INSERT OR REPLACE INTO watermarks VALUES (?, ?, ?)',
+            (resource, watermark, datetime.now(timezone.utc).isoformat()))
+    total = db.execute('SELECT COUNT(*) FROM {}'.format(resource)).fetchone()[0]
+    return {'fetched': fetched, 'total': total, 'watermark': watermark, 'full': full}
+
+def iso_date(value):
+    """Normalizes v2 (RFC 2822) and v3 (ISO 8601) dates to ISO 8601 UTC"""
+    if not value:
+        return None
+    try:
+        d = datetime.fromisoformat(value)
+    except ValueError:
+        try:
+            d = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return value
+    if d.tzinfo:
+        d = d.astimezone(timezone.utc)
+    return d.isoformat()
+
+
+# Snapshots ###################################################################
+
+# records per compressed ndjson chunk of a snapshot
+SNAPSHOT_CHUNK_RECORDS = 100000
+
+def write_snapshot(args, obj, hash=None):
+    """
+    Saves output (-o snapshot) to ~/.bigcli/<hash>/snapshots/<resource>-<method>/<time>/
+    as ndjson chunks, compressed with zstd if zstandard is installed or gzip
+    otherwise, and a manifest.json written last, so a folder without one is
+    an interrupted write. _last in the same folder points at the newest.
+    """
+    if inspect.isgenerator(obj) or type(obj) is list:
+        records = iterrecords(obj)
+    else:
+        records = iter([obj.__json__() if issubclass(type(obj), ApiResource) else obj])
+    group = snapshot_group(args, hash)
+    path = new_snapshot_dir(group)
+    ext, open_chunk = snapshot_codec()
+    dumps = json_encoder()[1]
+    parts = []
+    while True:
+        name = 'part-{:05d}.ndjson.{}'.format(len(parts), ext)
+        count = 0
+        with open_chunk(path + '/' + name, 'wb') as f:
+            for batch in chunks(itertools.islice(records, SNAPSHOT_CHUNK_RECORDS), 1000):
+                f.write(b''.join(dumps(r) + b'\n' for r in batch))
+                count += len(batch)
+        if not count and parts:
+            os.remove(path + '/' + name)
+            break
+        parts.append({'file': name, 'records': count, 'bytes': os.path.getsize(path + '/' + name)})
+        if count < SNAPSHOT_CHUNK_RECORDS:
+            break
+    manifest = {
+        'store_hash': hash,
+        'resource': getattr(args, 'resource', None),
+        'method': getattr(args, 'method', None) or getattr(args, 'task', None),
+        'ids': list(getattr(args, 'ids', None) or []),
+        'params': {p.split('=')[0]: tryParseInt(p.split('=')[1]) for p in getattr(args, 'params', None) or []},
+        'fields': getattr(args, 'fields', None) or [],
+        'where': getattr(args, 'where', None) or [],
+        'created': datetime.now(timezone.utc).isoformat(),
+        'records': sum(p['records'] for p in parts),
+        'bytes': sum(p['bytes'] for p in parts),
+        'compression': 'zstd' if ext == 'zst' else 'gzip',
+        'chunks': parts,
+    }
+    with open(path + '/manifest.json.tmp', 'w') as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(path + '/manifest.json.tmp', path + '/manifest.json')
+    point_last(path, group + '/_last')
+    args.output_path = path
+    print('[bigcli] saved {} records to {} ({})'.format(manifest['records'], path, human_bytes(manifest['bytes'])), file=sys.stderr)
+
+@functools.lru_cache(maxsize=None)
+def snapshot_codec():
+    """Returns (extension, open(path, mode)) for new snapshot chunks: zstd if zstandard is installed, else gzip"""
+    try:
+        import zstandard
+        return 'zst', lambda path, mode: zstandard.open(path, mode, cctx=zstandard.ZstdCompressor(level=3))
+    except ImportError:
+        return 'gz', lambda path, mode: gzip.open(path, mode, compresslevel=6)
+
+def open_snapshot_chunk(path):
+    """Opens a snapshot chunk for reading, decompressing it by its extension"""
+    if path.endswith('.zst'):
+        try:
+            import zstandard
+        except ImportError:
+            sys.exit('[bigcli] {} is zstd compressed. Install zstandard to read it: pip install zstandard'.format(path))
+        return io.BufferedReader(zstandard.open(path, 'rb'))
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+def read_snapshot_dir(path):
+    """Yields the records of a saved snapshot one at a time, a chunk at a time"""
+    with open(path + '/manifest.json') as f:
+        manifest = json.load(f)
+    for part in manifest['chunks']:
+        with open_snapshot_chunk(path + '/' + part['file']) as f:
+            for line in f:
+                yield json.loads(line)
+
+def snapshot_group(args, hash=None):
+    """Returns the folder that holds the snapshots of a command's output"""
+    name = output_filename(args, hash)
+    if hash:
+        name = name[len(hash) + 1:]
+    return (tmp_path(hash) if hash else tmp_path()) + '/snapshots/' + name
+
+def new_snapshot_dir(group):
+    """Creates and returns a folder in group named for the current UTC time"""
+    os.makedirs(group, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    for n in itertools.count():
+        path = group + '/' + stamp + ('-{}'.format(n) if n else '')
+        try:
+            os.mkdir(path)
+            return path
+        except FileExistsError:
+            continue
+
+def list_snapshots(group):
+    """Returns [(path, manifest)] for the complete snapshots in group, newest first"""
+    snapshots = []
+    for name in sorted(os.listdir(group), key=snapshot_order, reverse=True):
+        path = group + '/' + name
+        if name.startswith('_') or os.path.islink(path) or not os.path.exists(path + '/manifest.json'):
+            continue
+        with open(path + '/manifest.json') as f:
+            snapshots.append((path, json.load(f)))
+    return snapshots
+
+def snapshot_order(name):
+    """Sort key for snapshot folder names: the time, then the -N suffix of snapshots made in the same second"""
+    stamp, _, n = name.partition('-')
+    return stamp, int(n) if n.isdigit() else 0
+
+def snapshot_groups():
+    """Returns every snapshot group folder in ~/.bigcli"""
+    return sorted(glob.glob(tmp_path() + '/snapshots/*/') + glob.glob(tmp_path() + '/*/snapshots/*/'))
+
+def prune_snapshots(keep=5, older_than=None):
+    """
+    Deletes all but the newest `keep` snapshots of each group, the ones older
+    than `older_than` days, and interrupted writes over an hour old, then
+    points each group's _last at its newest remaining snapshot.
+    """
+    now = time.time()
+    removed = []
+    for group in snapshot_groups():
+        group = group.rstrip('/')
+        complete = list_snapshots(group)
+        for i, (path, manifest) in enumerate(complete):
+            if i >= keep or older_than is not None and now - os.path.getmtime(path + '/manifest.json') > older_than * 86400:
+                shutil.rmtree(path)
+                removed.append(path)
+        for name in os.listdir(group):
+            path = group + '/' + name
+            if name.startswith('_') or os.path.islink(path) or not os.path.isdir(path) or os.path.exists(path + '/manifest.json'):
+                continue
+            if now - os.path.getmtime(path) > 3600:
+                shutil.rmtree(path)
+                removed.append(path)
+        remaining = list_snapshots(group)
+        if remaining:
+            point_last(remaining[0][0], group + '/_last')
+        elif os.path.lexists(group + '/_last'):
+            os.remove(group + '/_last')
+    return removed
+
+def point_last(target, link):
+    """
+    Points link at target with a relative symlink. Where symlinks can't be
+    made, a file is copied instead, and a folder is named in a text file.
+    """
+    tmp = link + '.tmp'
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+    try:
+        os.symlink(os.path.relpath(target, os.path.dirname(link)), tmp)
+    except (OSError, NotImplementedError):
+        if os.path.isdir(target):
+            with open(tmp, 'w') as f:
+                f.write(os.path.basename(target))
+        else:
+            shutil.copyfile(target, tmp)
+    os.replace(tmp, link)
+
+def resolve_snapshot(path):
+    """Returns the snapshot folder a _last pointer or manifest.json path refers to, or path itself"""
+    if os.path.basename(path) == 'manifest.json':
+        return os.path.dirname(path)
+    if os.path.basename(path) == '_last' and os.path.isfile(path):
+        with open(path) as f:
+            return os.path.join(os.path.dirname(path), f.read().strip())
+    return path
+
+
+# Diff ########################################################################
+def diff(args, parser):
+    """
+    Compares a resource across two stores (-e and --against), or between a
+    saved snapshot and the live -e store, and outputs each record that was
+    added, removed or changed. --fields and --where narrow both sides first.
+    """
+    if bool(args.against) == bool(args.snapshot):
+        print('[bigcli] diff needs --against SUFFIX or --snapshot [PATH]. Ex: bigcli d Products -e DEV --against PROD')
+        return
+    hash = get_store_hash(args)
+    params = {p.split('=')[0]: tryParseInt(p.split('=')[1]) for p in args.params}
+    fields = list(dict.fromkeys([args.key] + args.fields)) if args.fields else []
+    where = args.where
+    args.fields, args.where = [], []  # they select the records compared, not the diff output
+    params.update(pushdown(args.resource, 'iterall', fields, where, params))
+    if args.snapshot:
+        path = latest_snapshot(args, hash, args.resource) if args.snapshot is True else args.snapshot
+        if not path:
+            print('[bigcli] no saved {0} output to compare with. Ex: bigcli a {0} iterall'.format(args.resource))
+            return
+        print('[bigcli] comparing {} with the live store'.format(path), file=sys.stderr)
+        before = read_snapshot(path)
+        after = live_records(args, args.resource, params)
+    else:
+        other = copy.copy(args)
+        other.env = args.against
+        before = live_records(args, args.resource, params)
+        after = live_records(other, args.resource, params)
+    try:
+        changes = diff_records(query(before, fields, where), query(after, fields, where), args.key, prefetch=bool(args.against))
+        output(args, changes, hash)
+    except (bigcommerce.exception.HttpException, session.RequestException) as e:
+        handleBigCommerceClientRequestException(e)
+
+def diff_records(before, after, key='id', prefetch=False):
+    """
+    Yields {'op': 'added'|'removed'|'changed', 'key': ...} for each record
+    that differs between before and after, matched on key. before is spilled
+    to a temp file as it's indexed by key -> (digest, offset), so only the
+    index stays in memory, and after is streamed past it once. With prefetch,
+    after is read into its own spill file meanwhile, so both sides download
+    at once. Changed records carry {field: [before, after]} for each
+    (flattened) field that differs.
+    """
+    dumps = json_encoder()[1]
+    counts = dict.fromkeys(['added', 'removed', 'changed', 'unchanged', 'no key'], 0)
+    index = {}
+    with tempfile.TemporaryFile() as spill, ThreadPoolExecutor(max_workers=1) as pool:
+        if prefetch:
+            after = pool.submit(spill_records, after, tempfile.TemporaryFile())
+        for r in before:
+            if r.get(key) is None:
+                counts['no key'] += 1
+                continue
+            line = dumps(r) + b'\n'
+            index[r[key]] = (hashlib.blake2b(line, digest_size=8).digest(), spill.tell())
+            spill.write(line)
+        if prefetch:
+            after = (json.loads(line) for line in after.result())
+
+        def read(offset):
+            spill.seek(offset)
+            return json.loads(spill.readline())
+
+        for r in after:
+            if r.get(key) is None:
+                counts['no key'] += 1
+                continue
+            found = index.pop(r[key], None)
+            if found is None:
+                counts['added'] += 1
+                yield {'op': 'added', 'key': r[key], 'record': r}
+                continue
+            changes = None
+            if found[0] != hashlib.blake2b(dumps(r) + b'\n', digest_size=8).digest():
+                changes = deltas(read(found[1]), r)
+            if not changes:
+                counts['unchanged'] += 1
+                continue
+            counts['changed'] += 1
+            yield {'op': 'changed', 'key': r[key], 'changes': changes}
+        for k, (digest, offset) in sorted(index.items(), key=lambda i: i[1][1]):
+            counts['removed'] += 1
+            yield {'op': 'removed', 'key': k, 'record': read(offset)}
+    print('[bigcli] diff: ' + ', '.join('{} {}'.format(v, k) for k, v in counts.items() if v or k != 'no key'), file=sys.stderr)
+
+def deltas(before, after):
+    """Returns {dotted field: [before, after]} for the fields that differ (see flatten)"""
+    a, b = flatten(before), flatten(after)
+    return {k: [a.get(k), b.get(k)] for k in dict.fromkeys(list(a) + list(b)) if a.get(k) != b.get(k)}
+
+def spill_records(records, f):
+    """Writes records to f as ndjson and returns f, rewound"""
+    dumps = json_encoder()[1]
+    for r in records:
+        f.write(dumps(r) + b'\n')
+    f.seek(0)
+    return f
+
+def live_records(args, resource, params):
+    """Returns a generator of every record of resource in the store args point at, as dicts"""
+    api = init_api_client(args)
+    res = getattr(api, resource)
+    if can_fetch_pages_concurrently(args, Resources.all_dict[resource], params):
+        return plain(iterall_concurrent(res, [], args.workers, **params))
+    return plain(res.iterall(**params))
+
+def read_snapshot(path):
+    """Yields the records in a saved json or ndjson output file, or an -o snapshot folder"""
+    path = resolve_snapshot(path)
+    if os.path.isdir(path):
+        yield from read_snapshot_dir(path)
+        return
+    with open(path) as f:
+        yield from iterjson(f)
+
+def latest_snapshot(args, hash, resource):
+    """Returns the newest all or iterall output or snapshot saved for the store's resource, if any"""
+    names = ['{}-{}-{}.{}'.format(hash, resource, m, ext) for m in ['iterall', 'all'] for ext in ['json', 'ndjson']]
+    paths = [os.path.join(d, n) for d in dict.fromkeys([output_dir(args, hash), tmp_path(hash)]) for n in names]
+    paths = [p for p in paths if os.path.exists(p)]
+    for m in ['iterall', 'all']:
+        last = os.path.realpath(resolve_snapshot('{}/snapshots/{}-{}/_last'.format(tmp_path(hash), resource, m)))
+        if os.path.exists(last + '/manifest.json'):
+            paths.append(last + '/manifest.json')
+    return max(paths, key=os.path.getmtime, default=None)
+
+
+# Copy ########################################################################
+
+# the order resources are copied in, so the ids a record points at are already mapped
+COPY_ORDER = ['Categories', 'Brands', 'Products', 'ProductVariants']
+
+# fields the API sets itself, dropped before a record is created on the target
+COPY_READ_ONLY = {
+    'Categories': ['id', 'parent_id', 'views'],
+    'Brands': ['id'],
+    'Products': ['id', 'date_created', 'date_modified', 'calculated_price', 'view_count', 'base_variant_id',
+        'reviews_rating_sum', 'reviews_count', 'variants'],
+    'ProductVariants': ['id', 'product_id', 'sku_id', 'calculated_price', 'calculated_weight', 'option_values'],
+}
+
+def copy_catalog(args, source, target_args, target):
+    """
+    Copies Categories, Brands and Products (with their variants) from the
+    source store to the target, in that order, remapping the ids each record
+    points at through the ids created before it. Records already on the
+    target (same category path, brand name or product name) are mapped
+    instead of copied again, so a rerun only creates what's missing. The ids
+    mapped are logged after each stage and product page for --resume.
+    With -D nothing is written: the report lists what would be created and
+    how the records already on the target differ.
+    """
+    checkpoint = Checkpoint(get_store_hash(args), 'copy', {'to': get_store_hash(target_args), 'dry': args.dry})
+    state = checkpoint.load() if args.resume and not args.dry else {}
+    ids = {r: {} for r in COPY_ORDER}
+    report = state.get('stats', {r: {'created': 0, 'existing': 0, 'failed': 0} for r in COPY_ORDER[:-1]})
+    report.setdefault('ProductVariants', {'mapped': 0, 'unmapped': 0})
+    for r in COPY_ORDER[:-1]:
+        report[r]['errors'] = []
+    diff = {r: {'create': [], 'changed': {}} for r in COPY_ORDER[:-1]}
+    start = time.monotonic()
+    dumps = json_encoder()[1]
+
+    # the ids mapped and errors of each stage and page are appended to a log, so the checkpoint stays small
+    log_path = checkpoint.path[:-len('.json')] + '.log.ndjson'
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    with open(log_path, 'r+b' if state.get('output') == log_path else 'w+b') as log:
+        checkpoint.attach(log)
+        log.seek(0)
+        for line in log:
+            entry = json.loads(line)
+            for r, mapped in entry['ids'].items():
+                ids[r].update(mapped)
+            for r, errors in entry['errors'].items():
+                report[r]['errors'] += errors
+        logged = {r: len(ids[r]) for r in COPY_ORDER}
+        logged_errors = {r: len(report[r]['errors']) for r in COPY_ORDER[:-1]}
+
+        def save(**progress):
+            """Logs what was mapped since the last save, then checkpoints the stage and page"""
+            if args.dry:
+                return
+            entry = {'ids': {r: dict(itertools.islice(ids[r].items(), logged[r], None)) for r in COPY_ORDER},
+                'errors': {r: report[r]['errors'][logged_errors[r]:] for r in COPY_ORDER[:-1]}}
+            log.write(dumps(entry) + b'\n')
+            logged.update((r, len(ids[r])) for r in COPY_ORDER)
+            logged_errors.update((r, len(report[r]['errors'])) for r in COPY_ORDER[:-1])
+            checkpoint.save(stats={r: without(s, ['errors']) for r, s in report.items()}, **progress)
+
+        try:
+            if state.get('stage') != 'Products':
+                copy_categories(args, source, target, ids, report['Categories'], diff['Categories'])
+                save(stage='Brands')
+                brands = [(b['name'], b) for b in plain(iterall_concurrent(source.Brands, [], args.workers))]
+                existing = {b['name']: b for b in plain(iterall_concurrent(target.Brands, [], args.workers))}
+                copy_records(args, target.Brands, brands, existing, ids['Brands'], report['Brands'], diff['Brands'],
+                    lambda b: without(b, COPY_READ_ONLY['Brands']))
+                save(stage='Products')
+            copy_products(args, source, target, ids, report, diff['Products'], save, state.get('page', 0) + 1)
+        except (Exception, KeyboardInterrupt):
+            if not args.dry:
+                print('\n[bigcli] copy stopped. Run again with --resume to continue.', file=sys.stderr)
+            raise
+    print('', file=sys.stderr)
+    checkpoint.clear()
+    os.remove(log_path)
+
+    report['seconds'] = round(time.monotonic() - start, 2)
+    if args.dry:
+        return {'dry_run': True, 'diff': diff, 'stats': report}
+    return {'ids': ids, 'stats': report}
+
+def copy_categories(args, source, target, ids, report, diff):
+    """Copies categories a tree level at a time, so each parent exists before its children"""
+    src = list(plain(iterall_concurrent(source.Categories, [], args.workers)))
+    dst = list(plain(iterall_concurrent(target.Categories, [], args.workers)))
+    existing = {path: c for path, c in zip(category_paths(dst), dst)}
+    levels = {}
+    for path, c in zip(category_paths(src), src):
+        levels.setdefault(path.count(' / '), []).append((path, c))
+
+    def prepare(c):
+        body = without(c, COPY_READ_ONLY['Categories'])
+        body['parent_id'] = ids['Categories'].get(str(c['parent_id']), 0) if c.get('parent_id') else 0
+        if c.get('parent_id') and not body['parent_id'] and not args.dry:
+            raise ValueError('parent category {} was not copied'.format(c['parent_id']))
+        return body
+
+    for depth in sorted(levels):
+        copy_records(args, target.Categories, levels[depth], existing, ids['Categories'], report, diff, prepare)
+
+def copy_products(args, source, target, ids, report, diff, save, start_page=1):
+    """Copies products a page at a time with their variants, then maps the variant ids by sku. save(page=) is called after each page"""
+    fields = {} if args.dry else {'include_fields': 'name'}
+    existing = {p['name']: p for p in plain(iterall_concurrent(target.Products, [], args.workers, include='variants', **fields))}
+    copied = 0
+
+    def prepare(p):
+        body = without(p, COPY_READ_ONLY['Products'])
+        body['categories'] = [ids['Categories'][str(c)] for c in p.get('categories', []) if str(c) in ids['Categories']]
+        if p.get('brand_id'):
+            body['brand_id'] = ids['Brands'].get(str(p['brand_id']), 0)
+        variants = [v for v in p.get('variants', []) if v.get('option_values')]
+        if variants:
+            body['variants'] = [dict(without(v, COPY_READ_ONLY['ProductVariants']), option_values=[
+                {'option_display_name': o['option_display_name'], 'label': o['label']} for o in v['option_values']])
+                for v in variants]
+        return body
+
+    for page, products in iterpages(source.Products, [], args.workers, start_page, include='variants'):
+        products = list(plain(products))
+        pairs = [(p['name'], p) for p in products]
+        created = copy_records(args, target.Products, pairs, existing, ids['Products'], report['Products'], diff, prepare)
+        new_ids = [str(new['id']) for p, new in created]
+        fetched = concurrent_map(lambda batch: target.Products.all(include='variants', limit=250, **{'id:in': ','.join(batch)}),
+            chunks(new_ids, 250), args.workers)
+        targets = {str(t['id']): t for batch in fetched for t in plain(batch or [])}
+        targets.update({str(existing[p['name']]['id']): existing[p['name']] for p in products if p['name'] in existing})
+        for p in products:
+            target_id = str(ids['Products'].get(str(p['id'])))
+            if target_id in targets:
+                map_variants(p, targets[target_id], ids['ProductVariants'], report['ProductVariants'])
+        copied += len(products)
+        save(stage='Products', page=page)
+        r = report['Products']
+        print_progress('[bigcli] Products: {} read, {} created, {} existing, {} failed'.format(copied, r['created'], r['existing'], r['failed']))
+
+def copy_records(args, resource, records, existing, ids, report, diff, prepare):
+    """
+    Creates each (key, record) in records on the target with up to -w requests
+    in flight, unless it was copied already or its key is in existing. Maps
+    source to target ids in ids, and returns [(record, created record)].
+    """
+    def create(item):
+        key, record = item
+        try:
+            return key, record, resource.create(**prepare(record)), None
+        except (bigcommerce.exception.HttpException, session.RequestException, ValueError) as e:
+            return key, record, None, e
+
+    todo = []
+    for key, record in records:
+        if str(record['id']) in ids:
+            continue
+        if key in existing:
+            ids[str(record['id'])] = existing[key]['id']
+            report['existing'] += 1
+            if args.dry:
+                changed = {k: [v, existing[key].get(k)] for k, v in prepare(record).items()
+                    if k != 'variants' and v != existing[key].get(k)}
+                if changed:
+                    diff['changed'][key] = changed
+        elif args.dry:
+            diff['create'].append(key)
+        else:
+            todo.append((key, record))
+
+    created = []
+    for key, record, new, e in concurrent_map(create, todo, args.workers):
+        if e is None:
+            ids[str(record['id'])] = new['id']
+            report['created'] += 1
+            created.append((record, new))
+        else:
+            report['failed'] += 1
+            report['errors'].append({'key': key, 'error': str(e)})
+    return created
+
+def map_variants(product, target, ids, report):
+    """Maps a product's variant ids to the target product's, by sku or else by position"""
+    variants = target.get('variants') or []
+    by_sku = {v['sku']: v['id'] for v in variants if v.get('sku')}
+    for i, v in enumerate(product.get('variants') or []):
+        id = by_sku.get(v.get('sku')) or (variants[i]['id'] if i < len(variants) and not v.get('sku') else None)
+        if id:
+            ids[str(v['id'])] = id
+            report['mapped'] += 1
+        else:
+            report['unmapped'] += 1
+
+def category_paths(categories):
+    """Returns each category's path of names from its root, ex: 'Shoes / Running'"""
+    by_id = {c['id']: c for c in categories}
+    paths = {}
+
+    def path(c, seen=()):
+        if c['id'] not in paths:
+            parent = by_id.get(c.get('parent_id'))
+            paths[c['id']] = c['name'] if not parent or parent['id'] in seen \
+                else path(parent, seen + (c['id'],)) + ' / ' + c['name']
+        return paths[c['id']]
+    return [path(c) for c in categories]
+
+def plain(objs):
+    """Yields api objects as dicts (an ApiResource's get is the api's, not dict.get)"""
+    for o in objs:
+        yield o.__json__()
+
+def without(record, fields):
+    return {k: v for k, v in record.items() if k not in fields}
+
+
+# Queries #####################################################################
+
+# v3 list filters by resource: field: supported operators ('' is an exact match)
+QUERY_FILTERS = {
+    'Products': {'id': ['in', 'min', 'max'], 'price': ['min', 'max'], 'weight': ['min', 'max'],
+        'inventory_level': ['in', 'min', 'max'], 'total_sold': ['min', 'max'], 'date_modified': ['min', 'max'],
+        'categories': ['in'], 'sku': ['in'], 'brand_id': [''], 'is_visible': [''], 'is_featured': [''],
+        'type': [''], 'name': ['']},
+    'Categories': {'id': ['in', 'min', 'max'], 'parent_id': ['in', 'min', 'max'], 'name': [''], 'is_visible': ['']},
+    'Brands': {'id': ['in', 'min', 'max'], 'name': ['']},
+    'Customers': {'id': ['in'], 'email': ['in'], 'customer_group_id': ['in'], 'date_modified': ['min', 'max']},
+}
+
+PREDICATE = re.compile(r'^\s*([\w.]+)\s*(<=|>=|!=|=|<|>|~)\s*(.*?)\s*$')
+
+def predicate(expr):
+    """
+    Parses a --where expression into (field, op, values). op is one of
+    = != < <= > >= or ~ (contains, ignoring case); = and != take comma
+    separated alternatives, ex: 'id=1,2,3'
+    """
+    m = PREDICATE.match(expr)
+    if not m:
+        raise argparse.ArgumentTypeError("can't parse '{}', expected field<op>value, ex: price>=10".format(expr))
+    field, op, value = m.groups()
+    values = value.split(',') if op in ['=', '!='] else [value]
+    return field, op, [json_value(v.strip()) for v in values]
+
+def field_list(s):
+    return [f.strip() for f in s.split(',') if f.strip()]
+
+def json_value(s):
+    """Reads numbers, true/false and null as json, anything else as a (unquoted) string"""
+    try:
+        return json.loads(s)
+    except ValueError:
+        return s.strip('\'"')
+
+def pushdown(resource, method, fields, where, params):
+    """
+    Returns query params that have the API do part of the --fields/--where
+    work for a v3 resource: include_fields, and the filters in QUERY_FILTERS
+    that return the same records or more. The full query still runs locally.
+    """
+    if getattr(Resources.all_dict[resource], 'resource_version', None) != 'v3':
+        return {}
+    pushed = {}
+    if fields and 'include_fields' not in params and 'exclude_fields' not in params:
+        needed = [f.split('.')[0] for f in fields] + [w[0].split('.')[0] for w in where]
+        pushed['include_fields'] = ','.join(dict.fromkeys(needed))
+    if method == 'get':
+        return pushed
+    filters = QUERY_FILTERS.get(resource, {})
+    for field, op, values in where:
+        supported = filters.get(field, [])
+        if op == '=' and 'in' in supported:
+            key = field + ':in'
+        elif op == '=' and '' in supported and len(values) == 1:
+            key = field
+        elif op in ['>', '>='] and 'min' in supported:
+            key = field + ':min'
+        elif op in ['<', '<='] and 'max' in supported:
+            key = field + ':max'
+        else:
+            continue
+        if key not in params and key not in pushed:
+            pushed[key] = ','.join(json.dumps(v) if isinstance(v, bool) or v is None else str(v) for v in values)
+    return pushed
+
+def select(obj, fields=[], where=[]):
+    """
+    Applies --fields and --where to output: records are filtered as they
+    stream by. A single object is projected, or None if --where rules it out.
+    """
+    if inspect.isgenerator(obj) or type(obj) is list:
+        return query(iterrecords(obj), fields, where)
+    if issubclass(type(obj), ApiResource):
+        obj = obj.__json__()
+    if where and isinstance(obj, dict):
+        matched = all(matches(obj, w) for w in where)
+        print('[bigcli] --where matched {} of 1 records'.format(int(matched)), file=sys.stderr)
+        if not matched:
+            return None
+    return project(obj, fields) if fields else obj
+
+def query(records, fields=[], where=[]):
+    """Yields the records matching every predicate in where, with only the given fields"""
+    scanned = matched = 0
+    for r in records:
+        scanned += 1
+        if not all(matches(r, w) for w in where):
+            continue
+        matched += 1
+        yield project(r, fields) if fields else r
+    if where:
+        print('[bigcli] --where matched {} of {} records'.format(matched, scanned), file=sys.stderr)
+
+def matches(record, predicate):
+    """returns true if any value at the predicate's field satisfies it (for !=, if none equal it)"""
+    field, op, targets = predicate
+    values = values_at(record, field.split('.'))
+    if op == '!=':
+        return not any(compare(v, '=', t) for v in values for t in targets)
+    return any(compare(v, op, t) for v in values for t in targets)
+
+def compare(value, op, target):
+    if value is None:
+        return False
+    if op == '~':
+        return str(target).lower() in str(value).lower()
+    if isinstance(target, bool) or isinstance(value, bool):
+        return op == '=' and value == target
+    if isinstance(target, (int, float)):
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            value, target = str(value), str(target)
+    else:
+        value, target = str(value), str(target)
+    return {'=': value == target, '<': value < target, '<=': value <= target,
+        '>': value > target, '>=': value >= target}[op]
+
+def values_at(obj, keys):
+    """Returns every value at a dotted path, looking into each item of the lists along the way"""
+    if isinstance(obj, list):
+        return [v for o in obj for v in values_at(o, keys)]
+    if not keys:
+        return [obj]
+    if isinstance(obj, dict) and keys[0] in obj:
+        return values_at(obj[keys[0]], keys[1:])
+    return []
+
+def project(record, fields):
+    """Returns record with only the given (dotted) fields, keeping their nesting"""
+    if not isinstance(record, dict):
+        return record
+    out = {}
+    for f in fields:
+        picked = pick(record, f.split('.'))
+        if picked is not None:
+            out = merge(out, picked)
+    return out
+
+def pick(obj, keys):
+    if not keys:
+        return obj
+    if isinstance(obj, list):
+        return [pick(o, keys) or {} for o in obj]
+    if isinstance(obj, dict) and keys[0] in obj:
+        picked = pick(obj[keys[0]], keys[1:])
+        return None if picked is None else {keys[0]: picked}
+    return None
+
+def merge(a, b):
+    if isinstance(a, dict) and isinstance(b, dict):
+        return dict(a, **{k: merge(a[k], v) if k in a else v for k, v in b.items()})
+    if isinstance(a, list) and isinstance(b, list) and len(a) == len(b):
+        return [merge(x, y) for x, y in zip(a, b)]
+    return b
+
 # Helpers #####################################################################
 def do_api_request(args, resource, method=None, ids=[], data=None, **params):
     """Uses CLI args to make api request and returns the response"""
-    hash = get_store_hash(args)
-    token = get_auth_token(args)
-    api = BigcommerceApi(store_hash=hash, access_token=token, version='latest',
-        rate_limiting_management= {'min_requests_remaining':2,
-                                    'wait':True,
-                                    'callback_function':None})
+    api = init_api_client(args)
     resource_str = resource
     cls = Resources.all_dict[resource]
     resource = getattr(api, resource)
@@ -348,6 +1380,13 @@ def do_api_request(args, resource, method=None, ids=[], data=None, **params):
             return getattr(resource, 'get')(ids[0], ids[1]).update(**data)
         if method and len(ids) == 3:
             return getattr(resource, 'get')(ids[0], ids[1], ids[2]).update(**data)
+    if method == 'iterall' and resumable(args, cls, data):
+        args.checkpoint = Checkpoint(get_store_hash(args), resource_str + '-iterall', [ids, data])
+        state = args.checkpoint.load() if args.resume else {}
+        pages = iterpages(resource, ids, args.workers, state.get('page', 0) + 1, **data)
+        return checkpointed(pages, args.checkpoint)
+    if method == 'iterall' and can_fetch_pages_concurrently(args, cls, data):
+        return iterall_concurrent(resource, ids, args.workers, **data)
     if method == 'all' or method == 'iterall' or method == 'get':
         if method and len(ids) == 0:
             return getattr(resource, method)(**data)
@@ -369,46 +1408,292 @@ def do_api_request(args, resource, method=None, ids=[], data=None, **params):
         if method and len(ids) == 3:
             return getattr(resource, 'get')(ids[0], ids[1], ids[2]).delete()
 
+def multi_get(args, resource, parent_ids, ids, **params):
+    """
+    Yields the records for many ids of one resource, in the order given.
+    Resources with an id:in filter (see QUERY_FILTERS) are fetched 250 ids
+    per list request; everything else with one get per id. Either way up to
+    args.workers requests are in flight. Ids that aren't found or fail are
+    reported on stderr once the rest are written.
+    """
+    api = init_api_client(args)
+    batched = 'in' in QUERY_FILTERS.get(resource, {}).get('id', [])
+    resource = getattr(api, resource)
+    ids = list(dict.fromkeys(str(i) for i in ids))
+    failed = {}
+
+    def get_batch(batch):
+        try:
+            objs = resource.all(*parent_ids, **dict(params, limit=250, **{'id:in': ','.join(batch)}))
+        except bigcommerce.exception.HttpException as e:
+            failed.update((id, str(e)) for id in batch)
+            return []
+        except session.RequestException as e:
+            failed.update((id, '{}: {}'.format(type(e).__name__, e)) for id in batch)
+            return []
+        found = {str(o['id']): o for o in objs or []}
+        return [(id, found[id]) for id in batch if id in found]
+
+    def get_one(id):
+        try:
+            return [(id, resource.get(*parent_ids, tryParseInt(id), **params))]
+        except bigcommerce.exception.HttpException as e:
+            if getattr(e, 'status_code', None) != 404:
+                failed[id] = str(e)
+            return []
+        except session.RequestException as e:
+            failed[id] = '{}: {}'.format(type(e).__name__, e)
+            return []
+
+    found = set()
+    results = request_map(resource, get_batch, chunks(ids, 250), args.workers) if batched \
+        else request_map(resource, get_one, ids, args.workers)
+    for objs in results:
+        for id, obj in objs:
+            found.add(id)
+            yield obj
+    missing = [id for id in ids if id not in found and id not in failed]
+    if missing:
+        print('[bigcli] {} of {} ids not found: {}'.format(len(missing), len(ids), ' '.join(missing)), file=sys.stderr)
+    for id, error in failed.items():
+        print('[bigcli] {} failed: {}'.format(id, error), file=sys.stderr)
+
+def read_ids(f):
+    """Reads ids from a file, one per line or separated by commas. Lines starting with # are skipped"""
+    return [id for line in f if not line.startswith('#') for id in re.split(r'[\s,]+', line.strip()) if id]
+
+def bulk_write(args, resource, method, ids, records, batch_size=10, progress=True):
+    """
+    Writes records in batches, with up to args.workers batches in flight.
+    Resources with collection updates get batch_size records per request;
+    everything else is written one record per request. Records that fail are
+    collected in the returned report instead of aborting the run.
+    """
+    api = init_api_client(args)
+    cls = Resources.all_dict[resource]
+    resource = getattr(api, resource)
+    batched = method == 'update' and isUpsertable(cls) and len(ids) == 0
+
+    def write_one(record):
+        if method == 'create':
+            return resource.create(*ids, **record)
+        record = dict(record)
+        return resource.get(*ids, record.pop('id')).update(**record)
+
+    def write_batch(batch):
+        try:
+            resource.update(batch) if batched else write_one(batch[0])
+            return len(batch), []
+        except (bigcommerce.exception.HttpException, KeyError, TypeError) as e:
+            if len(batch) == 1:
+                return 0, [{'record': batch[0], 'error': str(e)}]
+        except session.RequestException as e:
+            # the request didn't get through even after retries, so every record in it failed
+            return 0, [{'record': r, 'error': '{}: {}'.format(type(e).__name__, e)} for r in batch]
+        # a bad record fails its whole batch, so retry the batch one by one
+        results = [write_batch([r]) for r in batch]
+        return sum(r[0] for r in results), [e for r in results for e in r[1]]
+
+    report = {'written': 0, 'failed': 0, 'errors': []}
+    batch_size = batch_size if batched else 1
+    for written, errors in concurrent_map(write_batch, chunks(records, batch_size), args.workers):
+        report['written'] += written
+        report['failed'] += len(errors)
+        report['errors'] += errors
+        if progress:
+            print_progress(f"[bigcli] {method}: {report['written']} written, {report['failed']} failed")
+    if progress:
+        print('', file=sys.stderr)
+    return report
+
 def output(args, obj, hash=None):
     """Writes obj to file or stdout depending on args"""
+    if getattr(args, 'fields', None) or getattr(args, 'where', None):
+        obj = select(obj, args.fields, args.where)
+        if obj is None:
+            return
+    if args.out == 'snapshot':
+        return write_snapshot(args, obj, hash)
+    if args.stream and (inspect.isgenerator(obj) or type(obj) is list):
+        return stream_output(args, obj, hash)
     if inspect.isgenerator(obj) or type(obj) is list:
-        obj = iterall(obj)
+        obj = iterrecords(obj)
     elif not inspect.isgenerator(obj) and issubclass(type(obj), ApiResource):
         obj = obj.__json__()
-    if args.pretty_print and (args.out is None or args.out.name != 'csv'):
-        obj = json.dumps(obj, indent=4)
 
     # if -o, but no
     make_tmp_dirs_if_not_exist(hash)
 
-    filename = ''
-
-    if 'resource' in args and args.resource and hash:
-        filename = hash + '-' + args.resource + '-' + args.method
-    elif hash:
-        filename = hash + '-' + args.task
+    filename = output_filename(args, hash)
+    dir = output_dir(args, hash)
 
-    if not args.out:
-        args.out = open(tmp_path() + '/' + '_last.json', 'w')
-        args.out.write(obj)
-        args.out = open(tmp_path() + '/' + filename + '.json', 'w')
-    if args.out.name == 'json':
-        args.out = open(tmp_path() + '/' + filename + '.json', 'w')
-    if args.out.name == 'html':
-        args.out = open(tmp_path() + '/' + filename + 'html', 'w')
-    if args.out.name == 'txt':
-        args.out = open(tmp_path() + '/' + filename + '.txt', 'w')
-    if args.out.name == 'csv':
-        tocsv(obj, tmp_path() + '/' + filename + '.csv')
+    if args.out in ['csv', 'tsv']:
+        args.output_path = dir + '/' + filename + '.' + args.out
+        tocsv(obj, args.output_path, ',' if args.out == 'csv' else '\t')
         return 
+    if args.out in ['parquet', 'feather']:
+        args.output_path = dir + '/' + filename + '.' + args.out
+        tocolumnar([obj] if isinstance(obj, dict) else obj, args.output_path, args.out)
+        return
 
-    if type(obj) != str: 
-        obj = str(obj)
+    if not args.out or args.out in ['json', 'ndjson', 'html', 'txt']:
+        args.output_path = dir + '/' + filename + '.' + (args.out or 'json')
+    else:
+        args.output_path = args.out
+    out = open_out(args.output_path)
+    try:
+        if args.out == 'ndjson':
+            write_ndjson(obj if inspect.isgenerator(obj) or type(obj) is list else [obj], out)
+        else:
+            write_json(obj, out, args.pretty_print)
+    except BrokenPipeError:
+        reader_gone(args, obj)
+    if out is not sys.stdout:
+        out.close()
+    if not args.out:
+        point_last(args.output_path, dir + '/' + '_last.json')
 
-    args.out.write(obj)
+def stream_output(args, obj, hash=None):
+    """Writes records to file or stdout one at a time, as each page arrives"""
+    make_tmp_dirs_if_not_exist(hash)
+    dir = output_dir(args, hash)
+    path = dir + '/' + output_filename(args, hash)
+    records = iterrecords(obj)
+    if args.out in ['csv', 'tsv']:
+        args.output_path = path + '.' + args.out
+        return tocsv_stream(records, args.output_path, ',' if args.out == 'csv' else '\t')
+    if args.out in ['parquet', 'feather']:
+        args.output_path = path + '.' + args.out
+        return tocolumnar(records, args.output_path, args.out)
+    if not args.out or args.out in ['json', 'ndjson']:
+        args.output_path = path + '.ndjson'
+        checkpoint = getattr(args, 'checkpoint', None)
+        resuming = checkpoint and checkpoint.state.get('output') == args.output_path
+        with open(path + '.ndjson', 'r+b' if resuming else 'wb') as f:
+            if checkpoint:
+                checkpoint.attach(f)
+            write_ndjson(records, f)
+        if not args.out:
+            point_last(path + '.ndjson', dir + '/' + '_last.ndjson')
+        return
+    args.output_path = args.out
+    out = open_out(args.output_path)
+    try:
+        write_ndjson(records, out)
+    except BrokenPipeError:
+        reader_gone(args, obj)
+    if out is not sys.stdout:
+        out.close()
+
+def open_out(path):
+    """Opens the file -o names for writing, or returns stdout for '-'"""
+    return sys.stdout if path == '-' else open(path, 'wb')
+
+def reader_gone(args, records=None):
+    """
+    Exits quietly once whatever reads stdout stops early (ex: | head -1).
+    That isn't an interrupted dump, so any checkpoint is cleared rather than
+    kept to resume from.
+    """
+    if inspect.isgenerator(records):
+        records.close()
+    checkpoint = getattr(args, 'checkpoint', None)
+    if checkpoint:
+        checkpoint.clear()
+    # the flush at exit would fail again on the closed pipe
+    os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    sys.exit(0)
+
+def output_filename(args, hash=None):
+    """Returns the ~/.bigcli filename (without extension) for a command's output"""
+    if 'resource' in args and args.resource and hash:
+        return hash + '-' + args.resource + '-' + args.method
+    elif hash:
+        return hash + '-' + args.task
+    return ''
+
+def output_dir(args, hash=None):
+    """Returns ~/.bigcli, or the store's own ~/.bigcli/<hash> when running across stores"""
+    if getattr(args, 'per_store_output', False) and hash:
+        return tmp_path(hash)
+    return tmp_path()
+
+def write_ndjson(records, f):
+    """writes one json document per line"""
+    f = binary(f)
+    dumps = json_encoder()[1]
+    for r in records:
+        f.write(dumps(r) + b'\n')
+
+def write_json(obj, f, pretty=True):
+    """
+    Writes obj to f as json. Lists and generators are written a record at a
+    time, each pretty printed on its own, so a large result is never encoded
+    into one string.
+    """
+    f = binary(f)
+    dumps = json_encoder()[1]
+    if not (inspect.isgenerator(obj) or type(obj) is list):
+        f.write(dumps(obj, pretty))
+        return
+    indent = b'\n    ' if pretty else b''
+    empty = True
+    f.write(b'[')
+    for r in obj:
+        record = dumps(r, pretty)
+        f.write((b'' if empty else b',') + indent + (record.replace(b'\n', indent) if pretty else record))
+        empty = False
+    f.write(b']' if empty or not pretty else b'\n]')
+
+def binary(f):
+    """Returns the byte stream under a text file like sys.stdout, flushing what was written to it as text"""
+    if isinstance(f, io.TextIOBase) and hasattr(f, 'buffer'):
+        f.flush()
+        return f.buffer
+    return f
+
+@functools.lru_cache(maxsize=None)
+def json_encoder():
+    """
+    Returns (name, dumps) for the fastest json encoder installed: orjson,
+    ujson or the json module. dumps(obj, pretty=False) returns bytes: compact
+    utf-8, or pretty printed the way json.dumps(obj, indent=4) always has,
+    whichever encoder it is.
+    """
+    try:
+        import orjson
+        option = orjson.OPT_NON_STR_KEYS
+        return 'orjson', lambda obj, pretty=False: reindent(orjson.dumps(obj, default=json_default,
+            option=option | orjson.OPT_INDENT_2)) if pretty else orjson.dumps(obj, default=json_default, option=option)
+    except ImportError:
+        pass
+    try:
+        import ujson
+        return 'ujson', lambda obj, pretty=False: ujson.dumps(obj, indent=4 if pretty else 0,
+            ensure_ascii=pretty, escape_forward_slashes=False, default=json_default).encode()
+    except ImportError:
+        pass
+    return 'json', lambda obj, pretty=False: json.dumps(obj, indent=4 if pretty else None,
+        separators=None if pretty else (',', ':'), ensure_ascii=pretty, default=json_default).encode()
+
+INDENT = re.compile(rb'^ +', re.M)
+NON_ASCII = re.compile(rb'[\x80-\xff]+')
+
+def reindent(data):
+    """Turns orjson's pretty print (2 spaces, utf-8) into json.dumps(indent=4)'s: 4 spaces, non-ascii escaped"""
+    data = INDENT.sub(lambda m: m.group() * 2, data)
+    return NON_ASCII.sub(lambda m: json.dumps(m.group().decode())[1:-1].encode(), data)
+
+def json_default(obj):
+    """Encodes what json can't: resources, sets and anything else as a string"""
+    if hasattr(obj, '__json__'):
+        return obj.__json__()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    return str(obj)
 
 def handleBigCommerceClientRequestException(e):
-    print('bigcommerce.exception.ClientRequestException:\n')
+    print('{}.{}:\n'.format(type(e).__module__, type(e).__name__))
     print(e)
     if 'response' in vars(e) and 'url' in vars(e.response):
         print('\nFull URL: ' + e.response.url + '\n')  
@@ -423,7 +1708,7 @@ def tmp_path(hash=None):
 
 def make_tmp_dirs_if_not_exist(hash=None):
     if not tmp_path_exists(hash):
-        os.mkdir(tmp_path(hash))
+        os.makedirs(tmp_path(hash))
 
 def tmp_path_exists(hash=None):
     if hash:
@@ -433,6 +1718,12 @@ def tmp_path_exists(hash=None):
 def list_files():
     for file in os.listdir(tmp_path()):
         print("{}/{}".format(tmp_path(), file))
+    for group in snapshot_groups():
+        snapshots = list_snapshots(group.rstrip('/'))
+        if snapshots:
+            path, manifest = snapshots[0]
+            print("{}  ({} snapshots, newest {} records, {})".format(group, len(snapshots), manifest['records'],
+                human_bytes(manifest['bytes'])))
         
 def open_env():
     open_files_using_default_editor('.env')
@@ -448,7 +1739,7 @@ def open_files_using_default_editor(files='*'):
         print('[bigcli] Can\'t open files because EDITOR env var not set.')
 
 def list_api_resources():
-    for key in Resources.all:
+    for key in Resources.names():
         cls = Resources.all_dict[key]
         if issubsub(cls) and 'Resource' not in key and 'Mapping' not in key:
             print('{} -ids {{{}}} {{{}}} [id]'.format(key, cls.gparent_key, cls.parent_key))
@@ -484,6 +1775,10 @@ def isroot(cls):
     if issubclass(cls, ApiResource):
         return True
 
+def id_depth(cls):
+    """returns how many parent ids come before a resource's own id in -i"""
+    return 2 if issubsub(cls) else 1 if issub(cls) else 0
+
 def isUpsertable(cls):
     if issubclass(cls, CollectionUpdateableApiResource):
         return True
@@ -526,7 +1821,8 @@ def validate_ids(cls, resource_str, ids):
         return True
 
 def confirm(api, resource_str, ids=[]):
-        domain = api.Store.get().domain
+    with prompt_lock:
+        domain = store_domain(api)
         domainColor = color(domain, 'blue')
         action = color('DELETE', 'red')
         if len(ids) > 0:
@@ -546,30 +1842,329 @@ def confirm(api, resource_str, ids=[]):
                 print('[bigcli]: Delete aborted.\n')
             return confirmed
 
+def confirm_count(api, description, count):
+    """Asks once before deleting count things, ex: confirm_count(api, 'inactive themes', 12)"""
+    with prompt_lock:
+        domain = store_domain(api)
+        print("\n[bigcli]: {} {} {} on {}?".format(color('DELETE', 'red'), color(str(count), 'red'), description, color(domain, 'blue')))
+        check = "delete {} {}".format(count, description)
+        confirmed = input("[bigcli]: type '{}' to confirm: ".format(check)) == check
+        if not confirmed:
+            print('[bigcli]: Delete aborted.\n')
+        return confirmed
+
+prompt_lock = threading.Lock()
+
 def iterall(g):
-    l = []
-    for thing in g:
+    return list(iterrecords(g))
+
+def iterrecords(g):
+    """Yields each item in g as a dict without holding on to earlier items"""
+    for i, thing in enumerate(g):
         if issubclass(type(thing), ApiResource):
-            print_req_info('Items', thing, len(l), f"Getting all {thing.resource_name}...")
+            print_req_info('Items', thing, i, f"Getting all {thing.resource_name}...")
             thing = thing.__json__()
-        l.append(thing)
-    return l
+        yield thing
+
+def iterall_concurrent(resource, ids=[], workers=4, **params):
+    """Autopaging generator like iterall, but fetches v3 pages concurrently (see iterpages)"""
+    for page, objs in iterpages(resource, ids, workers, **params):
+        yield from objs
+
+def iterpages(resource, ids=[], workers=4, start_page=1, **params):
+    """
+    Yields (page, objects) for each page of a listable resource, starting at
+    start_page. When the first response has v3 pagination meta, the remaining
+    pages are fetched with up to `workers` requests in flight (still yielded
+    in page order). Otherwise pages are fetched one at a time.
+    """
+    params.update(limit=250)
+    first = resource.all(*ids, page=start_page, **params)
+    if type(first) is not list:
+        # an empty page comes back as one resource with no fields
+        yield start_page, [first] if first.__json__() else []
+        return
+    yield start_page, first
+    if len(first) < 250:
+        return
+    total_pages = pagination(first[-1]).get('total_pages')
+    fetch_page = lambda page: (page, resource.all(*ids, page=page, **params))
+    if total_pages and workers > 1:
+        yield from request_map(resource, fetch_page, range(start_page + 1, total_pages + 1), workers)
+        return
+    for page in itertools.count(start_page + 1):
+        page, objs = fetch_page(page)
+        if type(objs) is not list or not objs:
+            return
+        yield page, objs
+        if len(objs) < 250:
+            return
+
+def checkpointed(pages, checkpoint):
+    """Yields the objects in (page, objects) pairs, saving each page to checkpoint once it's been consumed"""
+    try:
+        for page, objs in pages:
+            yield from objs
+            checkpoint.save(page=page)
+    except (Exception, KeyboardInterrupt):
+        print_resume_hint(checkpoint)
+        raise
+    checkpoint.clear()
+
+def print_resume_hint(checkpoint):
+    if checkpoint.state.get('page'):
+        print('\n[bigcli] stopped after page {}. Run again with --resume to continue.'.format(checkpoint.state['page']), file=sys.stderr)
+
+class Checkpoint():
+    """
+    Progress of a long running iteration, saved to ~/.bigcli/<hash>/checkpoints/
+    after every finished page so --resume can pick up where a run stopped.
+    If the output went to a file, the checkpoint also holds the file's size
+    when the page finished, so a resumed run can drop a partly written page.
+    """
+
+    def __init__(self, hash, name, key=None):
+        digest = hashlib.sha1(json.dumps([name, key], sort_keys=True, default=str).encode()).hexdigest()[:10]
+        self.path = '{}/checkpoints/{}-{}.json'.format(tmp_path(hash), name, digest)
+        self.state = {}
+        self.file = None
+
+    def load(self):
+        """Loads the saved state, if there is one that can be resumed"""
+        try:
+            with open(self.path) as f:
+                self.state = json.load(f)
+        except (OSError, ValueError):
+            self.state = {}
+        if 'output' in self.state and not os.path.exists(self.state['output']):
+            print('[bigcli] {} is gone, starting over.'.format(self.state['output']), file=sys.stderr)
+            self.state = {}
+        return self.state
+
+    def attach(self, f):
+        """Tracks output file f. A resumed run truncates f to the last finished page."""
+        self.file = f
+        if self.state.get('output') == f.name:
+            f.seek(self.state['offset'])
+            f.truncate()
+
+    def save(self, **state):
+        self.state.update(state)
+        if self.file:
+            self.file.flush()
+            self.state.update(output=self.file.name, offset=self.file.tell())
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(self.state, f)
+        os.replace(self.path + '.tmp', self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def resumable(args, cls, params):
+    """returns true if an iterall of cls is checkpointed: streamed to stdout or ndjson, page by page"""
+    return args.stream and islistable(cls) and type(params) is dict and 'page' not in params and 'limit' not in params \
+        and args.out not in ['csv', 'tsv', 'parquet', 'feather', 'snapshot']
+
+def can_fetch_pages_concurrently(args, cls, params):
+    """returns true if iterall for cls can be split into concurrent page requests"""
+    if args.workers < 2 or 'page' in params or 'limit' in params:
+        return False
+    return getattr(cls, 'resource_version', None) == 'v3' and islistable(cls)
+
+def concurrent_map(fn, items, workers=4):
+    """Like map(fn, items), but with up to `workers` calls running at once. Yields in order."""
+    if workers < 2:
+        yield from map(fn, items)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        try:
+            for item in items:
+                pending.append(pool.submit(fn, item))
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for f in pending:
+                f.cancel()
+
+def request_map(resource, fn, items, workers=4):
+    """
+    concurrent_map for an fn that makes one GET request with resource: sent
+    from the async engine if the client has one (--engine async), else from
+    `workers` threads
+    """
+    engine = getattr(getattr(resource, 'connection', None), 'bigcli_engine', None)
+    if engine:
+        return engine.map(fn, items)
+    return concurrent_map(fn, items, workers)
+
+def pagination(resource):
+    """Returns meta.pagination from the v3 response a resource came from"""
+    try:
+        return response_meta(resource)['pagination']
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return {}
+
+def response_meta(resource):
+    """Returns meta from the last response on a resource's connection, decoding each response once"""
+    response = resource._connection._last_response
+    if not hasattr(response, 'bigcli_meta'):
+        response.bigcli_meta = response.json()['meta']
+    return response.bigcli_meta
+
+def chunks(items, size):
+    """Yields lists of up to size items from any iterable"""
+    items = iter(items)
+    while True:
+        chunk = list(itertools.islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+def iterjson(f, chunk_size=65536):
+    """
+    Yields json documents from a file one at a time without reading the whole
+    file. Accepts a top-level json array, ndjson, or a single document.
+    """
+    decoder = json.JSONDecoder()
+    buf, pos, array, eof = '', 0, None, False
+    while True:
+        while pos < len(buf) and buf[pos] in ' \t\r\n,':
+            pos += 1
+        if array is None and pos < len(buf):
+            array = buf[pos] == '['
+            pos += 1 if array else 0
+            continue
+        if array and buf[pos:pos + 1] == ']':
+            return
+        try:
+            if pos == len(buf) or not eof and len(buf) - pos < chunk_size:
+                raise ValueError('need more input')
+            obj, end = decoder.raw_decode(buf, pos)
+            if not eof and not buf[end:].strip('0123456789.eE+-'):
+                raise ValueError('number may continue in the next chunk, ex: 1.25e|3')
+        except ValueError:
+            if eof:
+                if buf[pos:].strip():
+                    obj, end = decoder.raw_decode(buf, pos)
+                else:
+                    return
+            else:
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buf, pos = buf[pos:] + chunk, 0
+                continue
+        yield obj
+        pos = end
 
 def init_api_client(args):
+    """
+    Returns the api client for the store args point at, building it once per
+    run. Clients are paced by the store's shared rate limiter, cache GETs,
+    and keep their connections alive in one pool for every request.
+    """
+    load_bigcommerce()
     hash = get_store_hash(args)
     token = get_auth_token(args)
-    return BigcommerceApi(store_hash=hash, access_token=token, version='latest')
+    with clients_lock:
+        if (hash, token) not in clients:
+            client = BigcommerceApi(store_hash=hash, access_token=token, version='latest')
+            cache = None
+            if not args.no_cache:
+                cache = session.ResponseCache(tmp_path(hash) + '/cache', ttl=args.cache_ttl, refresh=args.refresh)
+            clients[(hash, token)] = session.schedule(client, hash, args.workers, cache, args.retries)
+            if args.engine == 'async':
+                attach_async_engine(client, args.workers)
+        return clients[(hash, token)]
+
+clients = {}
+clients_lock = threading.Lock()
+
+def attach_async_engine(client, workers):
+    """Has the client's fan-out GETs sent from the async engine, or warns and stays sync without httpx"""
+    from bigcli import aio
+    try:
+        engine = aio.engine(max(workers, 1))
+    except ImportError:
+        print('[bigcli] --engine async needs httpx. Install it with: pip install httpx', file=sys.stderr)
+        return
+    if engine.concurrency != max(workers, 1):
+        print('[bigcli] the async engine is already running {} requests at once, not {}'.format(engine.concurrency, workers), file=sys.stderr)
+    engine.attach(client)
+
+def store_domain(api):
+    """Returns the store's domain, fetched once per client"""
+    return fetcher(api).submit('Store', 'get').result().domain
+
+class Fetcher():
+    """
+    Runs api calls concurrently, and shares one request between identical
+    calls made during a run. Ex: fetch.submit('WidgetRegions', 'all', template_file=t)
+    """
+
+    def __init__(self, api, workers=4):
+        self.api = api
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.futures = {}
+        self.lock = threading.Lock()
+
+    def submit(self, resource, method, *args, **params):
+        """Starts resource.method(*args, **params) unless it already ran, and returns its future"""
+        key = (resource, method, json.dumps(args, default=str), json.dumps(params, sort_keys=True, default=str))
+        with self.lock:
+            if key not in self.futures:
+                call = getattr(getattr(self.api, resource), method)
+                self.futures[key] = self.pool.submit(call, *args, **params)
+            return self.futures[key]
+
+def fetcher(api, workers=4):
+    """Returns the client's Fetcher, so identical calls are deduplicated across a run"""
+    with clients_lock:
+        if 'fetcher' not in vars(api):
+            vars(api)['fetcher'] = Fetcher(api, workers)
+        return vars(api)['fetcher']
+
+@functools.lru_cache(maxsize=None)
+def dot_env_values(path):
+    """Parses a .env file once per run"""
+    return dotenv_values(dotenv_path=path)
 
 def get_cwd_dot_env_value_for(var):
-    values = dotenv_values(dotenv_path=os.path.join(os.getcwd(), '.env'))
+    values = dot_env_values(os.path.join(os.getcwd(), '.env'))
     if var in values:
         return values[var]
 
 def get_tmp_dir_env_value_for(var):
-    values = dotenv_values(dotenv_path=os.path.join(tmp_path(), '.env'))
+    values = dot_env_values(os.path.join(tmp_path(), '.env'))
     if var in values:
         return values[var]
 
+def memoize_credential(fn):
+    """Resolves a credential (and prompts for it) at most once per .env suffix"""
+    values = {}
+    lock = threading.Lock()
+    @functools.wraps(fn)
+    def wrapper(args, prompt=True):
+        key = (args.prompt_for_creds, args.env)
+        with lock:
+            if key not in values:
+                values[key] = fn(args, prompt)
+            return values[key]
+    return wrapper
+
+def store_suffixes():
+    """Returns every SUFFIX with a BIGCLI_STORE_HASH_SUFFIX in .env files or the environment"""
+    prefix = 'BIGCLI_STORE_HASH_'
+    names = list(dot_env_values(os.path.join(os.getcwd(), '.env')))
+    names += list(dot_env_values(os.path.join(tmp_path(), '.env')))
+    names += list(os.environ)
+    return sorted({n[len(prefix):] for n in names if n.startswith(prefix)})
+
+@memoize_credential
 def get_store_hash(args, prompt=True):
     if args.prompt_for_creds:
         store_hash = input('Store Hash:')
@@ -590,6 +2185,7 @@ def get_store_hash(args, prompt=True):
             store_hash = os.environ.get("BIGCLI_STORE_HASH_{}".format(s))
     return store_hash
 
+@memoize_credential
 def get_auth_token(args, prompt=True):
     if args.prompt_for_creds:
         access_token = input('X-Auth-Token:')
@@ -608,15 +2204,146 @@ def get_auth_token(args, prompt=True):
             access_token = os.environ.get("BIGCLI_AUTH_TOKEN_{}".format(s))
     return access_token
 
-def tocsv(dict_list, filename):
-    """writes specified fields from list of dicts to csv"""
-    keys = [k for k in dict_list[0].keys()]
-    
-    with open(filename, 'a') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=keys, lineterminator='\n')
+def tocsv(obj, filename, delimiter=','):
+    """writes a dict or list of dicts to csv"""
+    tocsv_stream([obj] if isinstance(obj, dict) else obj, filename, delimiter)
+
+def tocsv_stream(dict_iter, filename, delimiter=',', sample_size=1000):
+    """
+    Writes dicts to csv as they arrive. Nested fields are flattened into dotted
+    columns, and the header is every column seen in the first sample_size
+    rows. Columns first seen after that go to a <filename>.extra.ndjson
+    sidecar (row number and values) so later rows never break the header.
+    """
+    rows = (flatten(d) for d in dict_iter)
+    sample = list(itertools.islice(rows, sample_size))
+    fieldnames = list(dict.fromkeys(k for row in sample for k in row))
+    columns = set(fieldnames)
+    extra = None
+    extra_rows = 0
+    with open(filename, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames, delimiter=delimiter, lineterminator='\n', extrasaction='ignore')
         writer.writeheader()
-        for dict in dict_list:
-            writer.writerow(dict)
+        for i, row in enumerate(itertools.chain(sample, rows), 1):
+            writer.writerow(row)
+            unknown = {k: v for k, v in row.items() if k not in columns}
+            if unknown:
+                extra = extra or open(filename + '.extra.ndjson', 'w')
+                extra.write(json.dumps({'row': i, 'columns': unknown}) + '\n')
+                extra_rows += 1
+    if extra:
+        extra.close()
+        print('[bigcli] {} rows had columns not in the header. See {}'.format(extra_rows, extra.name), file=sys.stderr)
+
+def tocolumnar(dict_iter, filename, format='parquet', batch_size=10000):
+    """
+    Writes dicts to a zstd compressed parquet or feather (arrow ipc) file, one
+    record batch at a time. Nested fields are flattened like tocsv_stream.
+    Records are spilled to a temp file first while every column and value
+    kind is noted, so the schema covers all keys, int columns that also hold
+    floats are widened to float64, and other mixes fall back to strings.
+    Anything that still can't convert goes to a <filename>.extra.ndjson
+    sidecar. Needs pyarrow.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet
+    except ImportError:
+        print('[bigcli] -o {} needs pyarrow. Install it with: pip install pyarrow'.format(format))
+        return
+    dumps = json_encoder()[1]
+    kinds = {}
+    with tempfile.TemporaryFile() as spill:
+        for r in (flatten(d) for d in dict_iter):
+            for k, v in r.items():
+                kinds.setdefault(k, set()).add(value_kind(v))
+            try:
+                spill.write(dumps(r) + b'\n')
+            except (TypeError, OverflowError):  # orjson can't encode ints past 64 bits
+                spill.write(json.dumps(r, default=json_default).encode() + b'\n')
+        spill.seek(0)
+        schema = pa.schema([(k, arrow_type(pa, v)) for k, v in kinds.items()])
+        if format == 'parquet':
+            writer = pa.parquet.ParquetWriter(filename, schema, compression='zstd')
+        else:
+            writer = pa.ipc.new_file(filename, schema, options=pa.ipc.IpcWriteOptions(compression='zstd'))
+        extra = None
+        extra_rows = 0
+        row = 0
+        for batch in chunks((json.loads(line) for line in spill), batch_size):
+            columns = []
+            misfits = [{} for r in batch]
+            for field in schema:
+                values = [r.get(field.name) for r in batch]
+                if pa.types.is_string(field.type):
+                    values = [v if v is None or isinstance(v, str) else json.dumps(v) for v in values]
+                try:
+                    columns.append(pa.array(values, type=field.type))
+                except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, ValueError, OverflowError):
+                    columns.append(pa.array(fit_values(pa, values, field, misfits), type=field.type))
+            for misfit in misfits:
+                row += 1
+                if misfit:
+                    extra = extra or open(filename + '.extra.ndjson', 'w')
+                    extra.write(json.dumps({'row': row, 'columns': misfit}, default=str) + '\n')
+                    extra_rows += 1
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+        writer.close()
+    if extra:
+        extra.close()
+        print('[bigcli] {} rows had values that don\'t fit the schema. See {}'.format(extra_rows, extra.name), file=sys.stderr)
+
+def value_kind(v):
+    """Returns the kind of a flattened value that decides its column's arrow type"""
+    if v is None or isinstance(v, (bool, str, float)):
+        return type(v).__name__
+    if isinstance(v, int):
+        return 'int' if -2**63 <= v < 2**63 else 'bigint'
+    return 'other'
+
+def arrow_type(pa, kinds):
+    """
+    Returns the arrow type that holds every value of the kinds seen in a
+    column: ints with floats widen to float64, and other mixes are strings
+    """
+    kinds = set(kinds) - {'NoneType'}
+    if not kinds:
+        return pa.string()
+    if kinds <= {'int'}:
+        return pa.int64()
+    if kinds <= {'int', 'float'}:
+        return pa.float64()
+    if kinds == {'bool'}:
+        return pa.bool_()
+    return pa.string()
+
+def fit_values(pa, values, field, misfits):
+    """Returns values with the ones that can't convert to field.type set to None (and noted in misfits)"""
+    fitted = []
+    for i, v in enumerate(values):
+        try:
+            pa.array([v], type=field.type)
+            fitted.append(v)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, ValueError, OverflowError):
+            fitted.append(None)
+            misfits[i][field.name] = v
+    return fitted
+
+def flatten(d, prefix=''):
+    """Flattens nested dicts and lists of dicts into one dict with dotted keys"""
+    flat = {}
+    for k, v in d.items():
+        key = prefix + str(k)
+        if isinstance(v, dict) and v:
+            flat.update(flatten(v, key + '.'))
+        elif isinstance(v, list) and v and all(isinstance(i, dict) for i in v):
+            for i, item in enumerate(v):
+                flat.update(flatten(item, '{}.{}.'.format(key, i)))
+        elif isinstance(v, (list, dict)):
+            flat[key] = json.dumps(v)
+        else:
+            flat[key] = v
+    return flat
 
 def color(text, option):
     return { "red": '\033[95m', "blue": '\033[94m',"green": '\033[92m', 
@@ -626,7 +2353,7 @@ def print_req_info(resource_str, resource, i=None, row=None):
     """For printing request and rate limit info when iterating over API resources"""
     if resource.resource_version == 'v3':
         try:
-            meta = resource._connection._last_response.json()['meta']
+            meta = response_meta(resource)
             total = meta['pagination']['total']
             if total > 0 and total / 250 > 0:
                 return
@@ -637,11 +2364,41 @@ def print_req_info(resource_str, resource, i=None, row=None):
                 f"Ms until reset:     {rl['ms_until_reset']}",
                 f"{resource_str} scanned:   {i} / {meta['pagination']['total']}"
             ])
-        except KeyError:
-            return
-        except TypeError:
+        except (KeyError, TypeError, AttributeError, ValueError):
             return
 
+def print_progress(row):
+    """Overwrites the current stderr line with row"""
+    print('\r' + row, end='', file=sys.stderr, flush=True)
+
+def print_profile(trace=None):
+    """Prints request stats per endpoint to stderr, and writes them with a trace of every request to trace"""
+    report = session.stats.report()
+    t = report['totals']
+    print('\n[bigcli] {} requests in {:.1f}s ({}/s), {} errors, {} retries, {} cache hits, {} in, {} out, '
+        '{:.1f}s rate limit wait, {:.1f}s backing off'.format(t['requests'], t['seconds'], t['requests_per_second'],
+        t['errors'], t['retries'], t['cache_hits'], human_bytes(t['bytes_in']), human_bytes(t['bytes_out']),
+        t['wait'], t['backoff']), file=sys.stderr)
+    rows = [['endpoint', 'count', 'errors', 'retries', 'p50 ms', 'p95 ms', 'p99 ms', 'in', 'wait s']]
+    for name, e in sorted(report['endpoints'].items(), key=lambda kv: -kv[1]['requests'] * kv[1]['p50_ms']):
+        rows.append([name, e['requests'], e['errors'], e['retries'], e['p50_ms'], e['p95_ms'], e['p99_ms'],
+            human_bytes(e['bytes_in']), e['wait']])
+    widths = [max(len(str(r[i])) for r in rows) for i in range(len(rows[0]))]
+    for r in rows:
+        print('  '.join(str(v).ljust(w) if i == 0 else str(v).rjust(w) for i, (v, w) in enumerate(zip(r, widths))),
+            file=sys.stderr)
+    if trace:
+        report['traceEvents'] = session.stats.events
+        with open(trace, 'w') as f:
+            json.dump(report, f)
+        print('[bigcli] trace written to {}'.format(trace), file=sys.stderr)
+
+def human_bytes(n):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if n < 1024 or unit == 'GB':
+            return '{:.0f}{}'.format(n, unit) if unit == 'B' else '{:.1f}{}'.format(n, unit)
+        n /= 1024
+
 def flush_print_rows(rows):
     cursor_up = '\x1b[1A'
     for r in rows:
@@ -649,21 +2406,75 @@ def flush_print_rows(rows):
     print(cursor_up*(len(rows)+1))
 
 class Resources():
-
-    def map_resources(all, type=ApiResource):
+    """
+    Index of bigcommerce api resources. Names are cached on disk per installed
+    bigcommerce version and resource module stamps (see bigcommerce_version),
+    so building the parser doesn't import bigcommerce.
+    all, all_dict and classes are filled in by load().
+    """
+    all = None
+    all_dict = None
+    classes = None
+
+    def map_resources(all, type):
         l = [k for k,v in all.items() if isclass(v) and issubclass(v, type)]
         return [i for i in l if not i.startswith("_") and 'Resource' not in i and 'Mapping' not in i]
 
-    def map_classes(all, type=ApiResource):
+    def map_classes(all, type):
         l = [v for k,v in all.items() if isclass(v) and issubclass(v, type)]
         return [i for i in l if not i.__name__.startswith("_") and 'Resource' not in i.__name__ and 'Mapping' not in i.__name__]
 
-    all = vars(bigcommerce.bigcommerce.resources.v2)
-    all.update(vars(bigcommerce.bigcommerce.resources.v3))
-    all_dict = all
-    classes = map_classes(all, ApiResource)
-    all = map_resources(all, ApiResource)
-    all.sort()
+    @classmethod
+    def load(cls):
+        all = dict(vars(bigcommerce.bigcommerce.resources.v2))
+        all.update(vars(bigcommerce.bigcommerce.resources.v3))
+        cls.all_dict = all
+        cls.classes = Resources.map_classes(all, ApiResource)
+        cls.all = sorted(Resources.map_resources(all, ApiResource))
+
+    @classmethod
+    def names(cls):
+        """Returns sorted resource names, from ~/.bigcli/.resources.json when it's current"""
+        if cls.all is not None:
+            return cls.all
+        path = tmp_path() + '/.resources.json'
+        version = bigcommerce_version()
+        try:
+            with open(path) as f:
+                cached = json.load(f)
+            if version and cached['version'] == version:
+                return cached['resources']
+        except (OSError, ValueError, KeyError):
+            pass
+        load_bigcommerce()
+        if version:
+            make_tmp_dirs_if_not_exist()
+            with open(path, 'w') as f:
+                json.dump({'version': version, 'resources': cls.all}, f)
+        return cls.all
+
+def bigcommerce_version():
+    """
+    Returns a key for the installed bigcommerce without importing it: its
+    version and location, plus the size and mtime of its resource modules, so
+    resources added to a git install with an unchanged version are picked up
+    """
+    from importlib import util
+    spec = util.find_spec('bigcommerce')
+    if not spec or not spec.origin:
+        return None
+    try:
+        from importlib import metadata  # python 3.8+
+        version = metadata.version('bigcommerce')
+    except ImportError:  # also PackageNotFoundError, ex: a source checkout on PYTHONPATH
+        version = ''
+    stamps = []
+    for dir, dirs, files in os.walk(os.path.join(os.path.dirname(spec.origin), 'resources')):
+        dirs.sort()
+        for file in sorted(f for f in files if f.endswith('.py')):
+            stat = os.stat(os.path.join(dir, file))
+            stamps.append('{}:{}:{}'.format(file, stat.st_size, stat.st_mtime_ns))
+    return '{} {} {}'.format(version, spec.origin, hashlib.sha1(' '.join(stamps).encode()).hexdigest()[:12])
 
 if __name__ == '__main__':
     main()
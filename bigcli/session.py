@@ -0,0 +1,469 @@
+import threading, time, os, json, hashlib, random, itertools
+import email.utils
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException, ConnectionError, ConnectTimeout, Timeout
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from urllib3.exceptions import NewConnectionError
+from urllib.parse import urlsplit
+
+"""
+bigcli.session - shared HTTP plumbing for bigcli's api clients.
+
+Every client bigcli builds gets a SchedulingAdapter mounted on its
+requests session, so all commands hitting a store share one rate limiter,
+retry transient failures, and, unless disabled, cache GET responses on disk.
+"""
+
+API_ORIGIN = 'https://api.bigcommerce.com'
+
+limiters = {}
+_limiters_lock = threading.Lock()
+
+class RateLimiter():
+    """
+    Token bucket paced by BigCommerce's X-Rate-Limit-* response headers.
+    Refills at the rate that spreads the requests left in the window over the
+    time until it resets, and holds every worker once only `reserve` are left.
+    Until a response carries the headers, requests aren't held back.
+    """
+
+    def __init__(self, reserve=2, burst=2):
+        self.reserve = reserve
+        self.burst = burst
+        self.tokens = burst
+        self.rate = None  # requests per second, unknown until the first response
+        self.resume_at = 0
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a request may be sent. Returns seconds spent waiting."""
+        start = time.monotonic()
+        while True:
+            wait = self.take()
+            if wait <= 0:
+                return time.monotonic() - start
+            time.sleep(wait)
+
+    def take(self):
+        """Takes a token and returns 0 if a request may be sent now, else the seconds to wait before trying again"""
+        with self.lock:
+            now = time.monotonic()
+            wait = self.resume_at - now
+            if wait > 0:
+                return wait
+            self._refill(now)
+            if self.tokens >= 1 or not self.rate:
+                self.tokens = max(self.tokens - 1, 0)
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def update(self, headers, status=None):
+        """Re-paces the bucket from a response's rate limit headers"""
+        try:
+            left = int(headers['X-Rate-Limit-Requests-Left'])
+            reset = max(int(headers['X-Rate-Limit-Time-Reset-Ms']), 1) / 1000
+        except (KeyError, ValueError):
+            return
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            if left <= self.reserve or status == 429:
+                self.resume_at = max(self.resume_at, now + reset)
+                self.tokens = 0
+            self.rate = max(left - self.reserve, 1) / reset
+
+    def _refill(self, now):
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+
+class ResponseCache():
+    """
+    On-disk cache of GET responses for one store. Entries are fresh for `ttl`
+    seconds, after which they are revalidated with If-None-Match /
+    If-Modified-Since when the API sent an ETag or Last-Modified header. The
+    least recently used entries are evicted once the cache passes max_bytes.
+    """
+
+    # headers that describe the original transfer rather than the content
+    skip_headers = ['content-encoding', 'content-length', 'transfer-encoding', 'connection']
+
+    def __init__(self, path, ttl=60, max_bytes=100 * 1024 * 1024, refresh=False):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.refresh = refresh
+        self.size = None
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def key(self, request):
+        accept = request.headers.get('Accept', '')
+        return hashlib.sha1('{} {} {}'.format(request.method, request.url, accept).encode()).hexdigest()
+
+    def get(self, request):
+        """Returns (meta, body) for a cached response to request, or None"""
+        if self.refresh:
+            return None
+        try:
+            with open(os.path.join(self.path, self.key(request)), 'rb') as f:
+                meta = json.loads(f.readline())
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        return meta, body
+
+    def is_fresh(self, meta):
+        return time.time() - meta['stored_at'] < self.ttl
+
+    def can_revalidate(self, meta):
+        return 'etag' in meta['headers'] or 'last-modified' in meta['headers']
+
+    def put(self, request, response):
+        headers = {k.lower(): v for k, v in response.headers.items()
+            if k.lower() not in self.skip_headers and not k.lower().startswith('x-rate-limit')}
+        meta = {'url': request.url, 'status': response.status_code, 'reason': response.reason,
+            'headers': headers, 'stored_at': time.time()}
+        self.write(self.key(request), meta, response.content)
+
+    def touch(self, request, meta, body):
+        """Marks a revalidated entry fresh again"""
+        meta['stored_at'] = time.time()
+        self.write(self.key(request), meta, body)
+
+    def write(self, key, meta, body):
+        path = os.path.join(self.path, key)
+        tmp = '{}.{}.tmp'.format(path, threading.get_ident())
+        head = json.dumps(meta).encode() + b'\n'
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(head)
+                f.write(body)
+            os.replace(tmp, path)
+        except OSError:
+            return
+        with self.lock:
+            if self.size is None:
+                self.size = sum(e.stat().st_size for e in os.scandir(self.path))
+            else:
+                self.size += len(head) + len(body)
+            if self.size > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        """Deletes least recently used entries until the cache is under 90% of max_bytes"""
+        entries = sorted(os.scandir(self.path), key=lambda e: e.stat().st_mtime)
+        self.size = sum(e.stat().st_size for e in entries)
+        for e in entries:
+            if self.size <= self.max_bytes * 0.9:
+                break
+            try:
+                self.size -= e.stat().st_size
+                os.remove(e.path)
+            except OSError:
+                pass
+
+    def clear(self):
+        """Drops every entry, ex: after a write to the store"""
+        with self.lock:
+            for e in os.scandir(self.path):
+                try:
+                    os.remove(e.path)
+                except OSError:
+                    pass
+            self.size = 0
+
+    def response(self, request, meta, body):
+        """Rebuilds a requests.Response from a cached entry"""
+        try:
+            os.utime(os.path.join(self.path, self.key(request)))
+        except OSError:
+            pass
+        response = requests.Response()
+        response.status_code = meta['status']
+        response.reason = meta['reason']
+        response.headers = CaseInsensitiveDict(meta['headers'])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = body
+        response.url = request.url
+        response.request = request
+        return response
+
+
+class Stats():
+    """
+    Request metrics per endpoint, for the run summary and --profile: counts,
+    retries, latencies, bytes sent and received, cache hits, and time spent
+    waiting on the rate limiter. When `trace` is set every request is also
+    kept as an event for a json trace.
+    """
+
+    latency_buckets = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]  # ms
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+        self.events = []
+        self.trace = False
+        self.started = time.monotonic()
+
+    def endpoint(self, method, url):
+        """Returns stats for the endpoint of a request, ex: GET /v3/catalog/products/{id}"""
+        key = endpoint_name(method, url)
+        if key not in self.endpoints:
+            self.endpoints[key] = {'requests': 0, 'errors': 0, 'retries': 0, 'cache_hits': 0,
+                'bytes_in': 0, 'bytes_out': 0, 'wait': 0.0, 'backoff': 0.0, 'latencies': []}
+        return self.endpoints[key]
+
+    def request(self, request, seconds, wait=0, response=None, bytes_in=0, attempt=0):
+        """Records one request sent to the API, or that failed to get a response"""
+        bytes_out = len(request.body or b'')
+        with self.lock:
+            e = self.endpoint(request.method, request.url)
+            e['requests'] += 1
+            e['errors'] += response is None or response.status_code >= 400
+            e['bytes_in'] += bytes_in
+            e['bytes_out'] += bytes_out
+            e['wait'] += wait
+            e['latencies'].append(seconds * 1000)
+            if self.trace:
+                self.events.append({'name': endpoint_name(request.method, request.url), 'ph': 'X',
+                    'ts': round((time.monotonic() - self.started - seconds) * 1e6), 'dur': round(seconds * 1e6),
+                    'pid': os.getpid(), 'tid': threading.get_ident(),
+                    'args': {'status': response.status_code if response is not None else None,
+                        'attempt': attempt, 'wait_ms': round(wait * 1000, 1),
+                        'bytes_in': bytes_in, 'bytes_out': bytes_out}})
+
+    def retry(self, request, backoff):
+        with self.lock:
+            e = self.endpoint(request.method, request.url)
+            e['retries'] += 1
+            e['backoff'] += backoff
+
+    def cache_hit(self, request):
+        with self.lock:
+            self.endpoint(request.method, request.url)['cache_hits'] += 1
+
+    @property
+    def requests(self):
+        return sum(e['requests'] for e in self.endpoints.values())
+
+    @property
+    def retries(self):
+        return sum(e['retries'] for e in self.endpoints.values())
+
+    def summary(self):
+        with self.lock:
+            endpoints = list(self.endpoints.values())
+        requests = sum(e['requests'] for e in endpoints)
+        latency = sum(sum(e['latencies']) for e in endpoints) / max(requests, 1)
+        return '{} requests, {} retries ({:.1f}s backing off), {:.0f}ms average latency'.format(
+            requests, sum(e['retries'] for e in endpoints), sum(e['backoff'] for e in endpoints), latency)
+
+    def report(self):
+        """Returns the run's totals and per endpoint stats, with latency percentiles and histograms"""
+        with self.lock:
+            endpoints = {k: dict(v, latencies=sorted(v['latencies'])) for k, v in self.endpoints.items()}
+        elapsed = time.monotonic() - self.started
+        for e in endpoints.values():
+            latencies = e.pop('latencies')
+            for p in [50, 95, 99]:
+                e['p{}_ms'.format(p)] = round(percentile(latencies, p), 1)
+            e['max_ms'] = round(latencies[-1], 1) if latencies else 0
+            e['histogram_ms'] = histogram(latencies, self.latency_buckets)
+            e['wait'] = round(e['wait'], 3)
+            e['backoff'] = round(e['backoff'], 3)
+        totals = {k: sum(e[k] for e in endpoints.values())
+            for k in ['requests', 'errors', 'retries', 'cache_hits', 'bytes_in', 'bytes_out', 'wait', 'backoff']}
+        totals['seconds'] = round(elapsed, 3)
+        totals['requests_per_second'] = round(totals['requests'] / max(elapsed, 1e-9), 1)
+        return {'totals': totals, 'endpoints': endpoints}
+
+stats = Stats()
+
+
+class SchedulingAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that waits on a RateLimiter before sending each request,
+    retries transient failures, and answers GET requests from a ResponseCache
+    when one is given.
+
+    Timeouts, connection errors, 429s and 5xx responses are retried up to
+    `retries` times with jittered exponential backoff, or after Retry-After /
+    the rate limit reset when the response has one. POSTs aren't idempotent,
+    so they're only retried when the store can't have processed them: the
+    connection was never made, or the request was rate limited.
+    """
+
+    retry_statuses = [429, 500, 502, 503, 504]
+    idempotent_methods = ['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE']
+
+    def __init__(self, limiter, cache=None, retries=5, backoff=0.5, max_backoff=30, **kwargs):
+        # ex: BIGCLI_API_ORIGIN=http://127.0.0.1:8000 to run against bench/mock_server.py
+        self.origin = os.environ.get('BIGCLI_API_ORIGIN', '').rstrip('/')
+        self.limiter = limiter
+        self.cache = cache
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        cached, response = self.before_send(request)
+        if response is not None:
+            return response
+        response = self.send_with_retries(request, **kwargs)
+        return self.after_send(request, cached, response, kwargs.get('stream'))
+
+    def before_send(self, request):
+        """
+        Points request at BIGCLI_API_ORIGIN if set, and looks it up in the
+        cache. Returns (cache entry, response): the response when a fresh entry
+        answers the request, else None and the request is made conditional on
+        the entry if it can be revalidated.
+        """
+        if self.origin and request.url.startswith(API_ORIGIN + '/'):
+            request.url = self.origin + request.url[len(API_ORIGIN):]
+        cached = None
+        if self.cache and request.method == 'GET':
+            cached = self.cache.get(request)
+        if cached and self.cache.is_fresh(cached[0]):
+            stats.cache_hit(request)
+            return cached, self.cache.response(request, *cached)
+        if cached and self.cache.can_revalidate(cached[0]):
+            headers = cached[0]['headers']
+            if 'etag' in headers:
+                request.headers['If-None-Match'] = headers['etag']
+            if 'last-modified' in headers:
+                request.headers['If-Modified-Since'] = headers['last-modified']
+        return cached, None
+
+    def after_send(self, request, cached, response, stream=False):
+        """Caches a GET's response (or answers a 304 from the cache), and clears the cache after a write"""
+        if self.cache and request.method == 'GET':
+            if cached and response.status_code == 304:
+                self.cache.touch(request, *cached)
+                return self.cache.response(request, *cached)
+            if response.status_code == 200 and not stream:
+                self.cache.put(request, response)
+        elif self.cache and response.status_code < 400:
+            self.cache.clear()
+        return response
+
+    def should_retry(self, request, attempt, response=None, error=None):
+        """Returns true if a failed attempt (an error response, or an error with none) can be retried"""
+        if attempt >= self.retries:
+            return False
+        if response is None:
+            return request.method in self.idempotent_methods or never_sent(error)
+        if response.status_code not in self.retry_statuses:
+            return False
+        return request.method in self.idempotent_methods or response.status_code == 429
+
+    def send_with_retries(self, request, **kwargs):
+        for attempt in itertools.count():
+            wait = self.limiter.acquire()
+            start = time.monotonic()
+            try:
+                response = super().send(request, **kwargs)
+                # read the body here so latency includes the transfer, as requests would anyway
+                bytes_in = len(response.content) if not kwargs.get('stream') else int(response.headers.get('Content-Length', 0))
+            except (ConnectionError, Timeout) as e:
+                stats.request(request, time.monotonic() - start, wait, attempt=attempt)
+                if not self.should_retry(request, attempt, error=e):
+                    raise
+                delay = self.backoff_delay(attempt)
+            else:
+                stats.request(request, time.monotonic() - start, wait, response, bytes_in, attempt)
+                self.limiter.update(response.headers, response.status_code)
+                if not self.should_retry(request, attempt, response):
+                    return response
+                delay = self.backoff_delay(attempt, response)
+                response.close()
+            stats.retry(request, delay)
+            time.sleep(delay)
+
+    def backoff_delay(self, attempt, response=None):
+        """Seconds to wait before retrying: Retry-After or the rate limit reset if sent, else full jitter backoff"""
+        if response is not None:
+            wait = retry_after(response.headers.get('Retry-After'))
+            if wait is None and response.status_code == 429 and 'X-Rate-Limit-Time-Reset-Ms' in response.headers:
+                wait = int(response.headers['X-Rate-Limit-Time-Reset-Ms']) / 1000
+            if wait is not None:
+                return min(wait, self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+
+def retry_after(value):
+    """Parses a Retry-After header (seconds or an http date) into seconds"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+def never_sent(error):
+    """Returns true if a requests exception means the request never reached the server"""
+    if isinstance(error, ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+def endpoint_name(method, url):
+    """Groups requests by path with the store hash dropped and ids replaced, ex: GET /v3/catalog/products/{id}"""
+    path = urlsplit(url).path.split('/')
+    if len(path) > 2 and path[1] == 'stores':
+        path = path[:1] + path[3:]
+    return '{} {}'.format(method, '/'.join('{id}' if p.isdigit() else p for p in path))
+
+def percentile(values, p):
+    """Nearest rank percentile of sorted values"""
+    if not values:
+        return 0
+    return values[max(0, min(len(values) - 1, int(round(p / 100 * len(values) + 0.5)) - 1))]
+
+def histogram(values, buckets):
+    """Counts values <= each bucket edge, plus a final count of larger values"""
+    counts = {'<={}'.format(b): 0 for b in buckets}
+    counts['>{}'.format(buckets[-1])] = 0
+    for v in values:
+        edge = next((b for b in buckets if v <= b), None)
+        counts['<={}'.format(edge) if edge is not None else '>{}'.format(buckets[-1])] += 1
+    return counts
+
+def rate_limiter(store_hash):
+    """
+    Returns the RateLimiter shared by every request made to store_hash. Its
+    reserve and burst don't grow with -w: the worker pool (or the async
+    engine's window) is what bounds the requests in flight.
+    """
+    with _limiters_lock:
+        if store_hash not in limiters:
+            limiters[store_hash] = RateLimiter()
+        return limiters[store_hash]
+
+def schedule(client, store_hash, workers=4, cache=None, retries=5):
+    """
+    Routes every request a BigcommerceApi client makes through the store's
+    rate limiter, retrying transient failures up to `retries` times, and
+    through cache (a ResponseCache) if given. All of the
+    client's connections share the adapter, and so one keep-alive pool.
+    """
+    adapter = SchedulingAdapter(rate_limiter(store_hash), cache, retries, pool_maxsize=max(10, workers))
+    for connection in connections(client):
+        connection.rate_limiting_management = None
+        connection._session.mount('https://', adapter)
+    return client
+
+def connections(client):
+    """Returns the connection objects held by a BigcommerceApi client"""
+    return [v for v in vars(client).values() if hasattr(v, '_session')]
@@ -19,6 +19,12 @@ setup(
     install_requires=[
         'bigcommerce @ git+https://github.com/aglensmith/bigcommerce-api-python.git@bigcli#egg=bigcommerce',
         'python-dotenv'],
+    extras_require={
+        'columnar': ['pyarrow'],
+        'fast': ['orjson'],
+        'async': ['httpx'],
+        'zstd': ['zstandard'],
+    },
     url='https://github.com/aglensmith/bigcommerce-cli-python',
     author='Austin Smith',
     description='A CLI tool for BigCommerce',
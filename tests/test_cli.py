@@ -0,0 +1,142 @@
+import io, json
+import pytest
+import requests
+from bigcli import cli, session
+
+
+# iterjson ####################################################################
+
+DOCS = [{'id': 1, 'name': 'a, [b]'}, {'id': 2, 'price': 10.5}, {'id': 3, 'tags': []}]
+
+@pytest.mark.parametrize('text', [
+    json.dumps(DOCS),
+    json.dumps(DOCS, indent=4),
+    '\n'.join(json.dumps(d) for d in DOCS) + '\n',
+])
+def test_iterjson_reads_arrays_and_ndjson(text):
+    assert list(cli.iterjson(io.StringIO(text))) == DOCS
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7])
+def test_iterjson_across_chunk_boundaries(chunk_size):
+    text = '[{"id": 12345, "name": "x"}, 67890, 1.25e3]'
+    assert list(cli.iterjson(io.StringIO(text), chunk_size)) == [{'id': 12345, 'name': 'x'}, 67890, 1250.0]
+
+def test_iterjson_single_document_and_empty():
+    assert list(cli.iterjson(io.StringIO('{"id": 1}'))) == [{'id': 1}]
+    assert list(cli.iterjson(io.StringIO('[]'))) == []
+    assert list(cli.iterjson(io.StringIO(''))) == []
+
+
+# predicate / pushdown ########################################################
+
+def test_predicate_parses_values_as_json():
+    assert cli.predicate('price>=10') == ('price', '>=', [10])
+    assert cli.predicate('id=1, 2,3') == ('id', '=', [1, 2, 3])
+    assert cli.predicate('is_visible != true') == ('is_visible', '!=', [True])
+    assert cli.predicate("name~'shoe, red'") == ('name', '~', ['shoe, red'])
+    assert cli.predicate('custom_url.url=/a/') == ('custom_url.url', '=', ['/a/'])
+
+def test_predicate_rejects_garbage():
+    with pytest.raises(Exception):
+        cli.predicate('price')
+
+def test_query_matches_every_predicate():
+    records = [{'id': 1, 'price': 5}, {'id': 2, 'price': 50}, {'id': 3, 'price': None}]
+    where = [cli.predicate('price>=10'), cli.predicate('id!=3')]
+    assert list(cli.query(iter(records), ['id'], where)) == [{'id': 2}]
+
+@pytest.fixture
+def resources():
+    pytest.importorskip('bigcommerce')
+    cli.load_bigcommerce()
+
+def test_pushdown_filters(resources):
+    where = [cli.predicate('id=1,2'), cli.predicate('price>10'), cli.predicate('name~shoe')]
+    assert cli.pushdown('Products', 'all', [], where, {}) == {'id:in': '1,2', 'price:min': '10'}
+
+def test_pushdown_include_fields_and_explicit_params(resources):
+    where = [cli.predicate('price<5')]
+    pushed = cli.pushdown('Products', 'all', ['id', 'custom_url.url'], where, {'price:max': '3'})
+    assert pushed == {'include_fields': 'id,custom_url,price'}
+    assert cli.pushdown('Products', 'get', ['id'], where, {}) == {'include_fields': 'id,price'}
+
+
+# snapshots ###################################################################
+
+def test_snapshot_order_sorts_collision_suffixes_numerically():
+    names = ['20240102T000000Z-10', '20240102T000000Z', '20240101T000000Z-3', '20240102T000000Z-2']
+    assert sorted(names, key=cli.snapshot_order) == \
+        ['20240101T000000Z-3', '20240102T000000Z', '20240102T000000Z-2', '20240102T000000Z-10']
+
+
+# Checkpoint ##################################################################
+
+@pytest.fixture
+def home(tmp_path, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmp_path))
+    return tmp_path
+
+def test_checkpoint_round_trip(home):
+    checkpoint = cli.Checkpoint('store', 'iterall', {'resource': 'Products'})
+    assert checkpoint.load() == {}
+    checkpoint.save(page=3, stats={'scanned': 750})
+    assert cli.Checkpoint('store', 'iterall', {'resource': 'Products'}).load() == {'page': 3, 'stats': {'scanned': 750}}
+    assert cli.Checkpoint('store', 'iterall', {'resource': 'Brands'}).load() == {}
+    checkpoint.clear()
+    assert cli.Checkpoint('store', 'iterall', {'resource': 'Products'}).load() == {}
+
+def test_checkpoint_resume_drops_partly_written_page(home):
+    path = str(home / 'out.ndjson')
+    checkpoint = cli.Checkpoint('store', 'iterall')
+    with open(path, 'wb') as f:
+        checkpoint.attach(f)
+        f.write(b'{"id": 1}\n')
+        checkpoint.save(page=1)
+        f.write(b'{"id": 2')
+
+    resumed = cli.Checkpoint('store', 'iterall')
+    assert resumed.load()['page'] == 1
+    with open(path, 'r+b') as f:
+        resumed.attach(f)
+        f.write(b'{"id": 2}\n')
+    with open(path, 'rb') as f:
+        assert f.read() == b'{"id": 1}\n{"id": 2}\n'
+
+def test_checkpoint_with_missing_output_starts_over(home):
+    checkpoint = cli.Checkpoint('store', 'iterall')
+    with open(str(home / 'out.ndjson'), 'wb') as f:
+        checkpoint.attach(f)
+        checkpoint.save(page=1)
+    (home / 'out.ndjson').unlink()
+    assert cli.Checkpoint('store', 'iterall').load() == {}
+
+
+# should_retry ################################################################
+
+def response(status):
+    r = requests.Response()
+    r.status_code = status
+    return r
+
+def request(method):
+    return requests.Request(method, 'http://example.com/').prepare()
+
+@pytest.fixture
+def adapter():
+    return session.SchedulingAdapter(session.RateLimiter(), retries=2)
+
+def test_should_retry_statuses(adapter):
+    assert adapter.should_retry(request('GET'), 0, response(503))
+    assert adapter.should_retry(request('GET'), 0, response(429))
+    assert not adapter.should_retry(request('GET'), 0, response(404))
+    assert not adapter.should_retry(request('GET'), 2, response(503))
+
+def test_should_retry_only_idempotent_methods_unless_rate_limited(adapter):
+    assert not adapter.should_retry(request('POST'), 0, response(503))
+    assert adapter.should_retry(request('POST'), 0, response(429))
+    assert adapter.should_retry(request('PUT'), 0, response(503))
+
+def test_should_retry_errors(adapter):
+    assert adapter.should_retry(request('GET'), 0, error=requests.exceptions.ReadTimeout())
+    assert not adapter.should_retry(request('POST'), 0, error=requests.exceptions.ReadTimeout())
+    assert adapter.should_retry(request('POST'), 0, error=requests.exceptions.ConnectTimeout())